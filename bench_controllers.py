@@ -0,0 +1,290 @@
+import sys
+import time
+import json
+import argparse
+import platform
+import logging
+import asyncio
+
+import numpy as np
+
+from sipyco.pc_rpc import Server, AsyncioClient
+
+from ptb import sim
+from ptb.synth_tcp import SynthTCP
+from ptb.voltage_tcp import VoltageTCP
+from ptb.temp_tcp import TempTCP
+from ptb.shutter_tcp import ShutterTCP
+
+
+drivers = {
+    "synth": SynthTCP,
+    "voltage": VoltageTCP,
+    "temp": TempTCP,
+    "shutter": ShutterTCP,
+}
+
+
+def synth_operations():
+    frequencies = np.linspace(2.0e9, 2.1e9, 12).tolist()
+    setup = [
+        ("set", (), {"ref_frequency": 100e6, "ref_div_factor": 4}),
+        ("build_hop_table", ("bench", frequencies), {}),
+    ]
+    regs = [0x00580005, 0x009c803c, 0x000404b3, 0x02004e42, 0x08008009,
+            0x00640000]
+    ops = [
+        ("ping", (), {}),
+        ("version", (), {}),
+        ("locked", (), {}),
+        ("set_frequency", (2.05e9,), {}),
+        ("start", (regs,), {}),
+        ("start", (regs,), {"delta": True}, "start(delta)"),
+        ("start_and_wait_locked", (regs,), {}),
+        ("hop", ("bench", 3), {}),
+        ("play_hops", ("bench", [0, 1, 2, 3]), {}),
+        ("save", (regs,), {}),
+        ("get_registers", (), {}),
+        ("get_lock_histogram", (), {}),
+        ("get_frequency_plan", (), {}),
+        ("search_plan", (2.05e9,), {}),
+        ("plan_frequencies", (frequencies,), {}),
+        ("decode_registers", (regs,), {}),
+        ("get_plan_cache_stats", (), {}),
+    ]
+    return setup, ops
+
+
+def voltage_operations():
+    values = np.linspace(-1, 1, 8).tolist()
+    data = list(range(0x7000, 0x9000, 0x400))
+    times = np.linspace(0, 1e-3, 10).tolist()
+    waveform = [values]*len(times)
+    ops = [
+        ("ping", (), {}),
+        ("version", (), {}),
+        ("get_temperature", (), {}),
+        ("set_voltage", (values,), {"force": True}),
+        ("set_voltage", (values,), {}, "set_voltage(cached)"),
+        ("set_gain", ([3276.8]*8,), {"force": True}),
+        ("set_offset", ([0]*8,), {"force": True}),
+        ("set_data", (data,), {"force": True}),
+        ("get_data", (), {}),
+        ("set_voltage_bulk", (values,), {}),
+        ("set_data_bulk", (data,), {}),
+        ("set_voltage_data", (values,), {}),
+        ("sync_calibration", (), {}),
+        ("voltage_to_data", (values,), {}),
+        ("predict_data", (values,), {}),
+        ("data_to_voltage", (data,), {}),
+        ("stream_voltage", (times, waveform), {}),
+        ("stream_voltage", (times, waveform), {"raw": True},
+         "stream_voltage(raw)"),
+        ("ldac", (), {}),
+        ("configure", (), {"gain": [3276.8]*8, "offset": [0]*8,
+                           "voltage": values}),
+        ("get_link_stats", (), {}),
+        ("get_stats", (), {}),
+        ("factory", (), {}),
+    ]
+    return [], ops
+
+
+def temp_operations():
+    setup = [("start_sampling", (.01,), {})]
+    ops = [
+        ("ping", (), {}),
+        ("version", (), {}),
+        ("get_all", (), {}),
+        ("get", (3,), {}),
+        ("get_latest", (), {}),
+        ("get_history", (), {}),
+        ("get_aggregates", (), {}),
+    ]
+    return setup, ops
+
+
+def shutter_operations():
+    setup = [("start_monitor", (.01,), {})]
+    ops = [
+        ("ping", (), {}),
+        ("version", (), {}),
+        ("status", (), {}),
+        ("clear", (), {}),
+        ("passthrough", (1, ord("W")), {}),
+        ("get_last_status", (), {}),
+    ]
+    return setup, ops
+
+
+operations = {
+    "synth": synth_operations,
+    "voltage": voltage_operations,
+    "temp": temp_operations,
+    "shutter": shutter_operations,
+}
+
+
+# Operations are (method, args, kwargs[, label]) tuples. The label
+# defaults to the method name and distinguishes calls of the same method
+# in the results.
+
+
+async def call(target, method, args, kwargs):
+    ret = getattr(target, method)(*args, **kwargs)
+    if asyncio.iscoroutine(ret):
+        ret = await ret
+    return ret
+
+
+async def measure(target, method, args, kwargs, n):
+    latency = np.empty(n)
+    t0 = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        await call(target, method, args, kwargs)
+        latency[i] = time.perf_counter() - t
+    duration = time.perf_counter() - t0
+    return {
+        "n": n,
+        "ops": n/duration,
+        "mean": float(latency.mean()),
+        "p50": float(np.percentile(latency, 50)),
+        "p99": float(np.percentile(latency, 99)),
+    }
+
+
+async def bench_device(kind, port, n, rpc_port=None):
+    """Benchmark all operations on a device, directly or through a
+    sipyco RPC server if `rpc_port` is given."""
+    dev = await drivers[kind].connect("127.0.0.1", port)
+    server = client = None
+    try:
+        if rpc_port is None:
+            target = dev
+        else:
+            server = Server({kind: dev}, None, True)
+            await server.start("127.0.0.1", rpc_port)
+            client = AsyncioClient()
+            await client.connect_rpc("127.0.0.1", rpc_port, kind)
+            target = client
+        setup, ops = operations[kind]()
+        for method, args, kwargs in setup:
+            await call(target, method, args, kwargs)
+        results = []
+        for op in ops:
+            method, args, kwargs = op[:3]
+            await call(target, method, args, kwargs)  # warm up
+            r = await measure(target, method, args, kwargs, n)
+            r.update(device=kind, method=op[3] if len(op) > 3 else method,
+                     mode="direct" if rpc_port is None else "rpc")
+            results.append(r)
+        return results
+    finally:
+        if client is not None:
+            client.close_rpc()
+        if server is not None:
+            await server.stop()
+        dev.close()
+
+
+def compare(results, baseline, tolerance):
+    """Return the results that are more than `tolerance` (relative)
+    slower than the baseline."""
+    base = {(r["device"], r["method"], r["mode"]): r
+            for r in baseline["results"]}
+    slower = []
+    for r in results:
+        b = base.get((r["device"], r["method"], r["mode"]))
+        if b is not None and r["ops"] < b["ops"]*(1 - tolerance):
+            slower.append((r, b))
+    return slower
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        description="""Benchmark the drivers directly and through sipyco
+        RPC against local device emulators.""")
+    parser.add_argument(
+        "devices", nargs="*", default=sorted(drivers),
+        help="Devices to benchmark (default: all).")
+    parser.add_argument(
+        "-n", type=int, default=200,
+        help="Calls per operation (default: %(default)s).")
+    parser.add_argument(
+        "--latency", type=float, default=0.,
+        help="Emulated device latency in seconds (default: %(default)g).")
+    parser.add_argument(
+        "--no-rpc", action="store_true",
+        help="Only benchmark direct driver calls.")
+    parser.add_argument(
+        "--rpc-port", type=int, default=3290,
+        help="Port for the RPC server (default: %(default)s).")
+    parser.add_argument(
+        "-o", "--output", default=None,
+        help="Write the results to this JSON file.")
+    parser.add_argument(
+        "-b", "--baseline", default=None,
+        help="Compare with the results in this JSON file and fail on "
+             "regressions.")
+    parser.add_argument(
+        "--tolerance", type=float, default=.2,
+        help="Relative ops/s loss considered a regression "
+             "(default: %(default)g).")
+    return parser
+
+
+def main():
+    args = get_argparser().parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    loop = asyncio.get_event_loop()
+
+    async def run():
+        results = []
+        for kind in args.devices:
+            emulator = sim.emulators[kind](latency=args.latency)
+            server = await emulator.start()
+            port = server.sockets[0].getsockname()[1]
+            try:
+                results.extend(await bench_device(kind, port, args.n))
+                if not args.no_rpc:
+                    results.extend(await bench_device(
+                        kind, port, args.n, args.rpc_port))
+            finally:
+                server.close()
+                await server.wait_closed()
+        return results
+
+    results = loop.run_until_complete(run())
+
+    print("{:8s} {:22s} {:6s} {:>10s} {:>10s} {:>10s}".format(
+        "device", "method", "mode", "ops/s", "p50/us", "p99/us"))
+    for r in results:
+        print("{device:8s} {method:22s} {mode:6s} {ops:10.1f} "
+              "{p50_us:10.1f} {p99_us:10.1f}".format(
+                  p50_us=r["p50"]*1e6, p99_us=r["p99"]*1e6, **r))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({
+                "time": time.time(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "n": args.n,
+                "latency": args.latency,
+                "results": results,
+            }, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.tolerance)
+        for r, b in slower:
+            print("regression: {device} {method} {mode}: {ops:.1f} ops/s, "
+                  "baseline {base:.1f} ops/s".format(base=b["ops"], **r))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import sys
+import time
+import logging
+import asyncio
+
+import numpy as np
+
+from ptb.synth_tcp import SynthTCP as Synth
+from ptb.synth_protocol import SynthProtocol
+
+
+class Loopback(SynthProtocol):
+    """Acknowledges commands without I/O to measure the host-side
+    overhead"""
+    def _encode(self, cmd):
+        return cmd.encode() + b"\n"
+
+    def _writeline(self, cmd):
+        pass
+
+    def _write(self, data):
+        pass
+
+    async def _read(self, n, timeout=None):
+        return b"ok\r\n"
+
+
+async def rate(f, n):
+    t0 = time.monotonic()
+    for i in range(n):
+        await f(i)
+    return n/(time.monotonic() - t0)
+
+
+def bench_plan(dev, n=10000):
+    # distinct frequencies: every call misses the plan cache
+    dev.set(ref_frequency=100e6, ref_div_factor=4)
+    frequencies = np.linspace(2.0e9, 2.1e9, n).tolist()
+    for level in (logging.WARNING, logging.INFO):
+        logging.getLogger("ptb.adf4350").setLevel(level)
+        t0 = time.monotonic()
+        for f in frequencies:
+            dev.set_frequency(f)
+        print("set_frequency, uncached, {}: {:.1f} us".format(
+            logging.getLevelName(level),
+            (time.monotonic() - t0)/n*1e6))
+    logging.getLogger("ptb.adf4350").setLevel(logging.NOTSET)
+
+
+async def bench(dev, n=1000):
+    dev.set(ref_frequency=100e6, ref_div_factor=4)
+    frequencies = np.linspace(2.0e9, 2.1e9, 12)
+    dev.build_hop_table("bench", frequencies)
+
+    async def start(i):
+        dev.set_frequency(frequencies[i % len(frequencies)])
+        await dev.start()
+
+    async def hop(i):
+        await dev.hop("bench", i % len(frequencies))
+
+    async def play(i):
+        await dev.play_hops("bench", range(len(frequencies)))
+
+    print("set_frequency + start: {:.1f} hops/s".format(await rate(start, n)))
+    print("hop: {:.1f} hops/s".format(await rate(hop, n)))
+    print("play_hops: {:.1f} hops/s".format(
+        len(frequencies)*await rate(play, n//len(frequencies))))
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    loop = asyncio.get_event_loop()
+    loop.set_debug(False)
+    async def run():
+        print("host only")
+        await bench(Loopback(), 100000)
+        bench_plan(Loopback())
+        host = sys.argv[1] if len(sys.argv) > 1 else "badoer"
+        with await Synth.connect(host) as dev:
+            print(host)
+            await bench(dev)
+    loop.run_until_complete(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import sys
+import time
+import logging
+import asyncio
+
+import numpy as np
+
+from ptb.voltage_tcp import VoltageTCP as Voltage
+from ptb.voltage_protocol import VoltageProtocol
+
+
+class Loopback(VoltageProtocol):
+    """Echoes commands without I/O to measure the host-side overhead"""
+    def _writeline(self, cmd):
+        self._echo = cmd
+
+    async def _readline(self, timeout=None):
+        return self._echo
+
+
+async def rate(f, n):
+    t0 = time.monotonic()
+    for i in range(n):
+        await f(i)
+    return n/(time.monotonic() - t0)
+
+
+async def bench(dev, n=1000, channels=8):
+    values = np.linspace(-1, 1, channels)
+    chans = list(range(1, channels + 1))
+
+    async def single(i):
+        await dev.set_voltage(values.tolist(), chans, force=True)
+
+    async def bulk(i):
+        await dev.set_voltage_bulk(values, chans)
+
+    async def bulk_noverify(i):
+        await dev.set_voltage_bulk(values, chans, verify=False)
+
+    async def pipelined(i):
+        await asyncio.gather(*[
+            dev.set_voltage_bulk(values, chans, verify=False)
+            for j in range(10)])
+
+    async def batched(i):
+        async with dev.batch():
+            futs = [asyncio.ensure_future(
+                dev.set_voltage_bulk(values, chans, verify=False))
+                for j in range(10)]
+        await asyncio.gather(*futs)
+
+    print("set_voltage: {:.1f} updates/s".format(await rate(single, n)))
+    print("set_voltage_bulk: {:.1f} updates/s".format(await rate(bulk, n)))
+    print("set_voltage_bulk(verify=False): {:.1f} updates/s".format(
+        await rate(bulk_noverify, n)))
+    print("set_voltage_bulk(verify=False), 10 in flight: "
+          "{:.1f} updates/s".format(10*await rate(pipelined, n//10)))
+    if hasattr(dev, "batch"):
+        print("set_voltage_bulk(verify=False), 10 batched: "
+              "{:.1f} updates/s".format(10*await rate(batched, n//10)))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    loop = asyncio.get_event_loop()
+    loop.set_debug(False)
+    async def run():
+        print("host only")
+        await bench(Loopback(), 20000)
+        host = sys.argv[1] if len(sys.argv) > 1 else "ascari"
+        with await Voltage.connect(host) as dev:
+            print(host)
+            await bench(dev)
+            await dev.factory()
+    loop.run_until_complete(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 from math import ceil
 from fractions import Fraction
+from collections import OrderedDict
 import logging
 
+import numpy as np
+
 
 logger = logging.getLogger(__name__)
 
@@ -112,6 +115,7 @@ class ADF4350:
     max_freq_refin = 250e6  # Hz
     max_modulus = 4095
     max_r_cnt = 1023
+    max_freq_ref_doubler = 30e6  # Hz
 
     ref_frequency = None
     ref_div_factor = None
@@ -140,13 +144,74 @@ class ADF4350:
     output_power = 3
     aux_output_power = 0
 
+    # instance attributes that feed into the register calculation
+    _plan_fields = (
+        "ref_frequency", "ref_div_factor", "ref_doubler_en", "ref_div2_en",
+        "channel_spacing", "phase_detector_polarity_positive_en",
+        "lock_detect_precision_6ns_en", "lock_detect_function_integer_n_en",
+        "charge_pump_curr", "muxout_select", "low_spur_mode_en",
+        "cycle_slip_reduction_en", "charge_cancellation_en",
+        "anti_backlash_3ns_en", "band_select_clock_mode_high_en",
+        "clk_divider_12bit", "clk_divider_mode",
+        "aux_output_en", "aux_output_fundamental_en", "mute_till_lock_en",
+        "output_power", "aux_output_power",
+        "max_out_freq", "min_out_freq", "min_vco_freq", "max_freq_45_presc",
+        "max_freq_pfd", "max_bandsel_clk", "max_modulus", "max_r_cnt",
+        "max_freq_ref_doubler")
+    plan_cache_size = 64
+    # details of a frequency plan, see get_frequency_plan()
+    _plan_params_fields = (
+        "f_out", "ref_doubler_en", "ref_div2_en", "r_cnt", "f_pfd",
+        "rf_div_sel", "prescaler_en", "n_int", "n_fract", "n_mod",
+        "band_sel_div", "frequency")
+
+    def __init__(self):
+        self._plan_cache = OrderedDict()
+        self._plan_cache_hits = 0
+        self._plan_cache_misses = 0
+        self._search_cache = OrderedDict()
+        self._plan_params = None
+        # registers (reg0 up to reg5) and output frequency last set
+        self._regs = None
+        self._frequency = None
+
     def _f_pfd(self, r_cnt):
         return self.ref_frequency * (1 + self.ref_doubler_en) / (
                 r_cnt * (1 + self.ref_div2_en))
 
+    def _plan_key(self, f_out):
+        return (f_out,) + tuple(getattr(self, k) for k in self._plan_fields)
+
+    def clear_plan_cache(self):
+        """Drop all cached register sets and frequency plan searches."""
+        self._plan_cache.clear()
+        self._search_cache.clear()
+
+    def get_plan_cache_stats(self):
+        """Return frequency plan cache statistics.
+
+        Returns:
+            dict: Number of cache `hits` and `misses`, current `size`
+                and `max_size` of the cache.
+        """
+        return {
+            "hits": self._plan_cache_hits,
+            "misses": self._plan_cache_misses,
+            "size": len(self._plan_cache),
+            "max_size": self.plan_cache_size,
+        }
+
     def set_frequency(self, f_out):
         """Set output frequency.
 
+        The register values are cached (least recently used, up to
+        :attr:`plan_cache_size` entries) keyed on the frequency and all
+        configuration attributes that affect them.
+
+        The details of the plan are only logged if the `INFO` level is
+        enabled for this module's logger. They are always available from
+        :meth:`get_frequency_plan`.
+
         Args:
             f_out (float): Desired frequency
         Returns:
@@ -156,6 +221,308 @@ class ADF4350:
         if not (self.min_out_freq <= f_out <= self.max_out_freq):
             raise ValueError("invalid frequency")
 
+        key = self._plan_key(f_out)
+        try:
+            regs, f, params = self._plan_cache[key]
+        except KeyError:
+            self._plan_cache_misses += 1
+            regs, f, params = self._plan(f_out)
+            self._plan_cache[key] = regs, f, params
+            while len(self._plan_cache) > self.plan_cache_size:
+                self._plan_cache.popitem(last=False)
+        else:
+            self._plan_cache_hits += 1
+            self._plan_cache.move_to_end(key)
+        self._regs = list(regs)
+        self._frequency = f
+        self._plan_params = params
+        return f
+
+    def get_frequency_plan(self):
+        """Return the details of the frequency plan last computed by
+        :meth:`set_frequency` or used by :meth:`apply_plan`.
+
+        The plan is assembled on request only and does not slow down
+        :meth:`set_frequency`.
+
+        Returns:
+            dict: Desired frequency `f_out`, the plan (named as in
+                :meth:`search_plan`), `f_vco` and the `channel_spacing`,
+                or `None` if no frequency has been set.
+        """
+        if self._plan_params is None:
+            return None
+        plan = dict(zip(self._plan_params_fields, self._plan_params))
+        plan["f_vco"] = plan["frequency"]*(1 << plan["rf_div_sel"])
+        plan["channel_spacing"] = plan["f_pfd"]/plan["n_mod"]
+        plan["error"] = plan["frequency"] - plan["f_out"]
+        return plan
+
+    def search_plan(self, f_out, objective="error", max_error=None):
+        """Search the reference path and modulus for the best plan.
+
+        All combinations of reference doubler, reference divide-by-2 and
+        R counter that give a valid PFD frequency are evaluated using
+        exact rational arithmetic. For each PFD frequency the closest
+        `n_fract/n_mod` with `n_mod <= max_modulus` is used, or, if
+        :attr:`channel_spacing` is set, the modulus derived from it.
+        The evaluated plans are memoized (keyed like the frequency plan
+        cache), so repeated searches, also with different objectives, are
+        cheap.
+
+        Args:
+            f_out (float): Desired frequency
+            objective (str): `"error"` to minimize the frequency error
+                (ties go to the higher PFD frequency, then the smaller
+                modulus) or `"pfd"` to maximize the PFD frequency for
+                lower phase noise (ties go to the smaller error).
+            max_error (float): Only consider plans with an absolute
+                frequency error of at most this many Hz.
+        Returns:
+            dict: The chosen plan: `ref_doubler_en`, `ref_div2_en`,
+                `r_cnt`, `f_pfd`, `rf_div_sel`, `prescaler_en`, `n_int`,
+                `n_fract`, `n_mod`, `band_sel_div`, the actual
+                `frequency` and its `error`. To report the trade-off,
+                `error_min` is the smallest absolute error and
+                `f_pfd_max` the highest PFD frequency of all
+                `candidates` admissible plans.
+        """
+        if not (self.min_out_freq <= f_out <= self.max_out_freq):
+            raise ValueError("invalid frequency")
+        if objective == "error":
+            def rank(c):
+                return abs(c["error"]), -c["f_pfd"], c["n_mod"]
+        elif objective == "pfd":
+            def rank(c):
+                return -c["f_pfd"], abs(c["error"]), c["n_mod"]
+        else:
+            raise ValueError("invalid objective")
+
+        key = self._plan_key(f_out)
+        try:
+            candidates = self._search_cache[key]
+        except KeyError:
+            candidates = self._search(Fraction(f_out))
+            self._search_cache[key] = candidates
+            while len(self._search_cache) > self.plan_cache_size:
+                self._search_cache.popitem(last=False)
+        else:
+            self._search_cache.move_to_end(key)
+
+        if max_error is not None:
+            max_error = Fraction(max_error)
+            candidates = [c for c in candidates
+                          if abs(c["error"]) <= max_error]
+        if not candidates:
+            raise ValueError("no admissible frequency plan")
+        plan = dict(min(candidates, key=rank))
+        plan["error_min"] = min(abs(c["error"]) for c in candidates)
+        plan["f_pfd_max"] = max(c["f_pfd"] for c in candidates)
+        plan["candidates"] = len(candidates)
+        for k in "f_pfd", "frequency", "error", "error_min", "f_pfd_max":
+            plan[k] = float(plan[k])
+        logger.info("PFD frequency %g MHz (max %g MHz), "
+                    "frequency error %g Hz (min %g Hz)",
+                    plan["f_pfd"]/1e6, plan["f_pfd_max"]/1e6,
+                    plan["error"], plan["error_min"])
+        return plan
+
+    def _search(self, f_out):
+        # determine output divider and VCO frequency
+        rf_div_sel = 0
+        f_vco = f_out
+        while f_vco < self.min_vco_freq:
+            rf_div_sel += 1
+            f_vco *= 2
+        assert 0 <= rf_div_sel <= 6
+        prescaler_en = f_vco > self.max_freq_45_presc
+        n_int_min = 75 if prescaler_en else 23
+
+        f_ref = Fraction(self.ref_frequency)
+        f_bandsel = Fraction(self.max_bandsel_clk)
+        candidates = []
+        seen = set()
+        for ref_doubler_en in (False, True):
+            if ref_doubler_en and f_ref > self.max_freq_ref_doubler:
+                continue
+            for ref_div2_en in (False, True):
+                f_r = f_ref*(1 + ref_doubler_en)/(1 + ref_div2_en)
+                r_min = max(1, ceil(f_r/Fraction(self.max_freq_pfd)))
+                for r_cnt in range(r_min, self.max_r_cnt + 1):
+                    f_pfd = f_r/r_cnt
+                    band_sel_div = f_pfd//f_bandsel
+                    if band_sel_div < 1:
+                        break
+                    # equivalent paths: keep the simplest
+                    if band_sel_div > 255 or f_pfd in seen:
+                        continue
+                    seen.add(f_pfd)
+                    n_int, df = divmod(f_vco, f_pfd)
+                    n_rat = df/f_pfd
+                    if not n_rat:
+                        n_fract, n_mod = 0, 1
+                    elif self.channel_spacing:
+                        n_mod = self._n_mod_spacing(float(f_pfd))
+                        if n_mod < 1:
+                            continue
+                        n_fract = round(n_rat*n_mod)
+                    else:
+                        n_rat = n_rat.limit_denominator(self.max_modulus)
+                        n_fract, n_mod = n_rat.numerator, n_rat.denominator
+                    if n_fract == n_mod:  # rounded up to the next integer
+                        n_int, n_fract = n_int + 1, 0
+                    if not n_int_min <= n_int <= 0xffff:
+                        continue
+                    if n_fract and self.lock_detect_function_integer_n_en:
+                        continue
+                    f = f_pfd*(n_int + Fraction(n_fract, n_mod))/(
+                        1 << rf_div_sel)
+                    candidates.append({
+                        "ref_doubler_en": ref_doubler_en,
+                        "ref_div2_en": ref_div2_en,
+                        "r_cnt": r_cnt,
+                        "f_pfd": f_pfd,
+                        "rf_div_sel": rf_div_sel,
+                        "prescaler_en": prescaler_en,
+                        "n_int": n_int,
+                        "n_fract": n_fract,
+                        "n_mod": n_mod,
+                        "band_sel_div": band_sel_div,
+                        "frequency": f,
+                        "error": f - f_out,
+                    })
+        return candidates
+
+    def apply_plan(self, plan):
+        """Use a frequency plan.
+
+        This sets :attr:`ref_doubler_en`, :attr:`ref_div2_en` and
+        :attr:`ref_div_factor` as well as the register values from the
+        plan. The frequency plan cache is not touched.
+
+        Args:
+            plan (dict): Frequency plan as returned by
+                :meth:`search_plan`.
+        Returns:
+            Actual output frequency set
+        """
+        self.ref_doubler_en = plan["ref_doubler_en"]
+        self.ref_div2_en = plan["ref_div2_en"]
+        self.ref_div_factor = plan["r_cnt"]
+        self._regs = self._make_regs(
+            plan["n_int"], plan["n_fract"], plan["n_mod"],
+            plan["prescaler_en"], plan["r_cnt"], plan["rf_div_sel"],
+            plan["band_sel_div"])
+        self._frequency = plan["frequency"]
+        self._plan_params = (plan["frequency"] - plan["error"],) + tuple(
+            plan[k] for k in self._plan_params_fields[1:])
+        return self._frequency
+
+    def decode_registers(self, regs, ref_frequency=None):
+        """Decode register values into their settings and frequency plan.
+
+        This is the inverse of the register calculation in
+        :meth:`set_frequency`. The registers are identified by their
+        control bits and can be given in any order (e.g. reg0 to reg5 as
+        in :meth:`plan_frequencies` or reg5 to reg0 as in
+        :meth:`SynthProtocol.get_registers`). Many register sets can be
+        decoded at once.
+
+        Args:
+            regs (array(int)): Register values, shape (6,) or (N, 6)
+            ref_frequency (float): Reference frequency. Defaults to
+                :attr:`ref_frequency`.
+        Returns:
+            dict: Settings, named like the corresponding attributes where
+                there is one, the frequency plan (named as in
+                :meth:`search_plan`) and the output `frequency`. `valid`
+                indicates whether the plan satisfies the constraints
+                checked by :meth:`set_frequency`. Values are scalars for
+                a single register set and arrays of shape (N,) otherwise.
+        """
+        if ref_frequency is None:
+            ref_frequency = self.ref_frequency
+        if ref_frequency is None:
+            raise ValueError("reference frequency unknown")
+        regs = np.asarray(regs, dtype=np.int64)
+        single = regs.ndim == 1
+        regs = np.atleast_2d(regs)
+        if regs.ndim != 2 or regs.shape[1] != 6:
+            raise ValueError("register sets must have six values")
+        ctrl = regs & 7
+        order = np.argsort(ctrl, axis=1)
+        if np.any(np.take_along_axis(ctrl, order, axis=1) != np.arange(6)):
+            raise ValueError("invalid control bits")
+        r0, r1, r2, r3, r4, r5 = np.take_along_axis(regs, order, axis=1).T
+
+        d = {
+            "n_fract": (r0 >> 3) & 0xfff,
+            "n_int": (r0 >> 15) & 0xffff,
+            "n_mod": (r1 >> 3) & 0xfff,
+            "phase": (r1 >> 15) & 0xfff,
+            "prescaler_en": (r1 & self.reg1_prescaler) != 0,
+            "counter_reset_en": (r2 & self.reg2_counter_reset_en) != 0,
+            "cp_threestate_en": (r2 & self.reg2_cp_threestate_en) != 0,
+            "powerdown_en": (r2 & self.reg2_power_down_en) != 0,
+            "phase_detector_polarity_positive_en":
+                (r2 & self.reg2_pd_polarity_pos) != 0,
+            "lock_detect_precision_6ns_en": (r2 & self.reg2_ldp_6ns) != 0,
+            "lock_detect_function_integer_n_en":
+                (r2 & self.reg2_ldf_int_n) != 0,
+            "charge_pump_curr": (((r2 >> 9) & 0xf) + 1)*312,
+            "double_buff_en": (r2 & self.reg2_double_buff_en) != 0,
+            "r_cnt": (r2 >> 14) & 0x3ff,
+            "ref_div2_en": (r2 & self.reg2_rdiv2_en) != 0,
+            "ref_doubler_en": (r2 & self.reg2_rmult2_en) != 0,
+            "muxout_select": (r2 >> 26) & 0x7,
+            "low_spur_mode_en": ((r2 >> 29) & 0x3) == 0x3,
+            "clk_divider_12bit": (r3 >> 3) & 0xfff,
+            "clk_divider_mode": (r3 >> 16) & 0x3,
+            "cycle_slip_reduction_en": (r3 & self.reg3_12bit_csr_en) != 0,
+            "charge_cancellation_en":
+                (r3 & self.reg3_charge_cancellation_en) != 0,
+            "anti_backlash_3ns_en":
+                (r3 & self.reg3_anti_backlash_3ns_en) != 0,
+            "band_select_clock_mode_high_en":
+                (r3 & self.reg3_band_sel_clock_mode_high) != 0,
+            "output_power": (r4 >> 3) & 0x3,
+            "rf_out_en": (r4 & self.reg4_rf_out_en) != 0,
+            "aux_output_power": (r4 >> 6) & 0x3,
+            "aux_output_en": (r4 & self.reg4_aux_output_en) != 0,
+            "aux_output_fundamental_en":
+                (r4 & self.reg4_aux_output_fund) != 0,
+            "mute_till_lock_en": (r4 & self.reg4_mute_till_lock_en) != 0,
+            "vco_powerdown_en": (r4 & self.reg4_vco_pwrdown_en) != 0,
+            "band_sel_div": (r4 >> 12) & 0xff,
+            "rf_div_sel": (r4 >> 20) & 0x7,
+            "feedback_fund_en": (r4 & self.reg4_feedback_fund) != 0,
+            "ld_pin_mode": (r5 >> 22) & 0x3,
+        }
+
+        n_mod = np.maximum(d["n_mod"], 1)
+        r_cnt = np.maximum(d["r_cnt"], 1)
+        f_pfd = ref_frequency*(1 + d["ref_doubler_en"])/(
+            r_cnt*(1 + d["ref_div2_en"]))
+        f_n = f_pfd*(d["n_int"] + d["n_fract"]/n_mod)
+        div = np.left_shift(1, d["rf_div_sel"])
+        # with divided feedback the N counter sees the output frequency
+        f_vco = np.where(d["feedback_fund_en"], f_n, f_n*div)
+        d["f_pfd"] = f_pfd
+        d["f_vco"] = f_vco
+        d["frequency"] = f_vco/div
+        n_int_min = np.where(d["prescaler_en"], 75, 23)
+        d["valid"] = (
+            (d["r_cnt"] >= 1) & (f_pfd <= self.max_freq_pfd) &
+            (d["n_mod"] >= 1) & (d["n_fract"] < d["n_mod"]) &
+            (d["n_int"] >= n_int_min) & (d["band_sel_div"] >= 1) &
+            (d["rf_div_sel"] <= 6) &
+            (self.min_vco_freq <= f_vco) & (f_vco <= self.max_out_freq) &
+            ~(d["lock_detect_function_integer_n_en"] & (d["n_fract"] > 0)))
+        if single:
+            d = {k: v[0].item() for k, v in d.items()}
+        return d
+
+    def _plan(self, f_out):
         # determine output divider and VCO frequency
         rf_div_sel = 0
         f_vco = f_out
@@ -163,43 +530,29 @@ class ADF4350:
             rf_div_sel += 1
             f_vco *= 2
         assert 0 <= rf_div_sel <= 6
-        logger.info("VCO frequency %g GHz", f_vco/1e9)
-        logger.info("output divider %i", 1 << rf_div_sel)
 
         # select prescaler
         prescaler_en = f_vco > self.max_freq_45_presc
-        logger.info("prescaler_en %i", prescaler_en)
 
         # select reference divider and PFD frequency
-        r_cnt = self.ref_div_factor
-        if not r_cnt:
-            r_cnt = ceil(self._f_pfd(1)/self.max_freq_pfd)
-        assert 1 <= r_cnt <= self.max_r_cnt
-        logger.info("R counter value %i", r_cnt)
+        r_cnt = self._r_cnt()
         f_pfd = self._f_pfd(r_cnt)
         assert f_pfd <= self.max_freq_pfd
-        logger.info("PFD frequency %g MHz", f_pfd/1e6)
 
         n_int, df = divmod(f_vco, f_pfd)
         n_int = int(n_int)
         n_int_min = 75 if prescaler_en else 23
         assert n_int_min <= n_int <= 1 << 16
-        logger.info("N divider integral part %i", n_int)
-        logger.info("N divider fractional part %g MHz", df/1e6)
         if df:
             if self.channel_spacing:
-                n_mod = int(round(f_pfd/self.channel_spacing))
-                while n_mod > self.max_modulus:
-                    n_mod //= 2
+                n_mod = self._n_mod_spacing(f_pfd)
                 n_fract = int(round(df/f_pfd*n_mod))
             else:
                 n_rat = Fraction(df/f_pfd)
-                logger.info("N divider fraction %s", n_rat)
                 n_rat = n_rat.limit_denominator(self.max_modulus)
                 n_fract, n_mod = n_rat.numerator, n_rat.denominator
-            logger.info("N divider fract/mod %i/%i", n_fract, n_mod)
-            logger.info("channel spacing %g kHz", f_pfd/n_mod/1e3)
-            logger.info("frequency error %g Hz", f_pfd*n_fract/n_mod - df)
+            if n_fract == n_mod:  # rounded up to the next integer
+                n_int, n_fract = n_int + 1, 0
         else:
             n_fract = 0
             n_mod = 1
@@ -209,18 +562,62 @@ class ADF4350:
             assert not self.lock_detect_function_integer_n_en
 
         # determine clock divider for band selection logic
+        band_sel_div = self._band_sel_div(f_pfd)
+
+        regs = self._make_regs(n_int, n_fract, n_mod, prescaler_en, r_cnt,
+                               rf_div_sel, band_sel_div)
+        f = f_pfd*(n_int + n_fract/n_mod)/(1 << rf_div_sel)
+        params = (f_out, self.ref_doubler_en, self.ref_div2_en, r_cnt,
+                  f_pfd, rf_div_sel, prescaler_en, n_int, n_fract, n_mod,
+                  band_sel_div, f)
+        if logger.isEnabledFor(logging.INFO):
+            self._log_plan(params)
+        return tuple(regs), f, params
+
+    def _log_plan(self, params):
+        (f_out, _, _, r_cnt, f_pfd, rf_div_sel, prescaler_en, n_int,
+         n_fract, n_mod, band_sel_div, f) = params
+        logger.info("VCO frequency %g GHz", f*(1 << rf_div_sel)/1e9)
+        logger.info("output divider %i", 1 << rf_div_sel)
+        logger.info("prescaler_en %i", prescaler_en)
+        logger.info("R counter value %i", r_cnt)
+        logger.info("PFD frequency %g MHz", f_pfd/1e6)
+        logger.info("N divider integral part %i", n_int)
+        logger.info("N divider fract/mod %i/%i", n_fract, n_mod)
+        logger.info("channel spacing %g kHz", f_pfd/n_mod/1e3)
+        logger.info("frequency error %g Hz", f - f_out)
+        logger.info("VCO band selection logic clock divider %i",
+                    band_sel_div)
+
+    def _r_cnt(self):
+        r_cnt = self.ref_div_factor
+        if not r_cnt:
+            r_cnt = ceil(self._f_pfd(1)/self.max_freq_pfd)
+        assert 1 <= r_cnt <= self.max_r_cnt
+        return r_cnt
+
+    def _n_mod_spacing(self, f_pfd):
+        n_mod = int(round(f_pfd/self.channel_spacing))
+        while n_mod > self.max_modulus:
+            n_mod //= 2
+        return n_mod
+
+    def _band_sel_div(self, f_pfd):
         band_sel_div = int(f_pfd / self.max_bandsel_clk)
         assert 1 <= band_sel_div <= 255
-        logger.info("VCO band selection logic clock divider %i", band_sel_div)
+        return band_sel_div
 
-        self._regs = list(range(6))  # control bits
+    def _make_regs(self, n_int, n_fract, n_mod, prescaler_en, r_cnt,
+                   rf_div_sel, band_sel_div):
+        # works on scalars as well as on numpy arrays
+        regs = list(range(6))  # control bits
 
-        self._regs[0] |= self.reg0_int(n_int) | self.reg0_fract(n_fract)
+        regs[0] |= self.reg0_int(n_int) | self.reg0_fract(n_fract)
 
-        self._regs[1] |= (self.reg1_phase(1) | self.reg1_mod(n_mod) |
+        regs[1] |= (self.reg1_phase(1) | self.reg1_mod(n_mod) |
                 (prescaler_en * self.reg1_prescaler))
 
-        self._regs[2] |= (
+        regs[2] |= (
                 self.reg2_10bit_r_cnt(r_cnt) |
                 (0 * self.reg2_double_buff_en) |
                 (self.ref_doubler_en * self.reg2_rmult2_en) |
@@ -234,7 +631,7 @@ class ADF4350:
                 self.reg2_muxout(self.muxout_select) |
                 self.reg2_noise_mode(self.low_spur_mode_en*0x3))
 
-        self._regs[3] |= (
+        regs[3] |= (
                 (self.cycle_slip_reduction_en * self.reg3_12bit_csr_en) |
                 (self.charge_cancellation_en *
                     self.reg3_charge_cancellation_en) |
@@ -244,7 +641,7 @@ class ADF4350:
                 self.reg3_12bit_clkdiv(self.clk_divider_12bit) |
                 self.reg3_12bit_clkdiv_mode(self.clk_divider_mode))
 
-        self._regs[4] |= (self.reg4_feedback_fund |
+        regs[4] |= (self.reg4_feedback_fund |
                 self.reg4_rf_div_sel(rf_div_sel) |
                 self.reg4_8bit_band_sel_clkdiv(band_sel_div) |
                 self.reg4_rf_out_en |
@@ -254,9 +651,152 @@ class ADF4350:
                 (self.aux_output_fundamental_en * self.reg4_aux_output_fund) |
                 (self.mute_till_lock_en * self.reg4_mute_till_lock_en))
 
-        self._regs[5] |= self.reg5_ld_pin_mode_digital | 0x00180000
+        regs[5] |= self.reg5_ld_pin_mode_digital | 0x00180000
+
+        return regs
+
+    def plan_frequencies(self, f_out):
+        """Compute register values for many output frequencies at once.
+
+        This is the vectorized equivalent of calling :meth:`set_frequency`
+        for each frequency. The results are bit-identical. Nothing is logged
+        and neither the registers used by :meth:`SynthProtocol.start` nor
+        the frequency plan cache are touched.
+
+        Args:
+            f_out (array(float)): Desired frequencies, shape (N,)
+        Returns:
+            tuple(array, array, array): Register values (shape (N, 6),
+                uint32, reg0 to reg5), actual output frequencies, and
+                frequency errors (actual minus desired).
+        """
+        f_out = np.asarray(f_out, dtype=np.float64)
+        if f_out.ndim != 1:
+            raise ValueError("frequencies must be one-dimensional")
+        if not np.all((self.min_out_freq <= f_out) &
+                      (f_out <= self.max_out_freq)):
+            raise ValueError("invalid frequency")
+
+        # determine output divider and VCO frequency
+        rf_div_sel = np.zeros(f_out.shape, np.int64)
+        f_vco = f_out
+        while True:
+            low = f_vco < self.min_vco_freq
+            if not low.any():
+                break
+            rf_div_sel += low
+            f_vco = np.where(low, f_vco*2, f_vco)
+        assert np.all(rf_div_sel <= 6)
 
-        return f_pfd*(n_int + n_fract/n_mod)/(1 << rf_div_sel)
+        # select prescaler
+        prescaler_en = f_vco > self.max_freq_45_presc
+
+        # select reference divider and PFD frequency
+        r_cnt = self._r_cnt()
+        f_pfd = self._f_pfd(r_cnt)
+        assert f_pfd <= self.max_freq_pfd
+
+        n_int, df = np.divmod(f_vco, f_pfd)
+        n_int = n_int.astype(np.int64)
+        n_int_min = np.where(prescaler_en, 75, 23)
+        assert np.all((n_int_min <= n_int) & (n_int <= 1 << 16))
+        if self.channel_spacing:
+            n_mod = np.full(f_out.shape, self._n_mod_spacing(f_pfd), np.int64)
+            n_fract = np.rint(df/f_pfd*n_mod).astype(np.int64)
+        else:
+            n_fract, n_mod = _limit_denominator(df/f_pfd, self.max_modulus)
+        fract = df != 0
+        carry = fract & (n_fract == n_mod)
+        n_int = n_int + carry
+        n_fract = np.where(fract & ~carry, n_fract, 0)
+        n_mod = np.where(fract, n_mod, 1)
+        assert np.all((1 <= n_mod) & (n_mod <= self.max_modulus))
+        assert np.all((0 <= n_fract) & (n_fract < n_mod))
+        if np.any(n_mod > 1):
+            assert not self.lock_detect_function_integer_n_en
+
+        # determine clock divider for band selection logic
+        band_sel_div = self._band_sel_div(f_pfd)
+
+        regs = np.empty(f_out.shape + (6,), np.uint32)
+        for i, reg in enumerate(self._make_regs(
+                n_int, n_fract, n_mod, prescaler_en, r_cnt,
+                rf_div_sel, band_sel_div)):
+            regs[:, i] = reg
+        f = f_pfd*(n_int + n_fract/n_mod)/np.left_shift(1, rf_div_sel)
+        return regs, f, f - f_out
+
+
+def _pow2_divmod(e, n, clamp):
+    """Elementwise `min(2**e//n, clamp)` and `2**e % n` for int64 arrays
+    with `e >= 0`, `1 <= n < 2**53` and `clamp < 2**61`.
+
+    Long division, one bit per iteration beyond `2**52`."""
+    e0 = np.minimum(e, 52)
+    p = np.left_shift(1, e0)
+    q = np.minimum(p // n, clamp)
+    r = p % n
+    for i in range(int(np.max(e - e0, initial=0))):
+        more = e - e0 > i
+        r2 = 2*r
+        carry = r2 >= n
+        q = np.where(more, np.minimum(2*q + carry, clamp), q)
+        r = np.where(more, r2 - carry*n, r)
+    return q, r
+
+
+def _limit_denominator(x, max_denominator):
+    """Vectorized `Fraction(x).limit_denominator(max_denominator)`.
+
+    Args:
+        x (array(float)): Values in `[0, 1)`
+        max_denominator (int): At most `2**12 - 1`
+    Returns:
+        tuple(array(int), array(int)): Numerators and denominators
+    """
+    assert max_denominator < 1 << 12
+    zero = x == 0
+    # exact representation x = n/2**e with odd n < 2**53, e >= 1
+    m, e = np.frexp(np.where(zero, .5, x))
+    n = (m*float(1 << 53)).astype(np.int64)
+    e = 53 - e.astype(np.int64)
+    _, tz = np.frexp((n & -n).astype(np.float64))
+    tz = tz.astype(np.int64) - 1
+    n >>= tz
+    e -= tz
+    # denominator already small enough
+    exact = e <= max_denominator.bit_length() - 1
+
+    # continued fraction expansion of n/2**e with the big 2**e removed
+    # in the first step: after it, all remainders are smaller than n
+    p0, q0, p1, q1 = 1, 0, 0, 1
+    # 2**e//n > max_denominator for e > 53 + 13
+    a, r = _pow2_divmod(np.minimum(e, 53 + 13), n, max_denominator + 1)
+    go = ~(zero | exact) & (a <= max_denominator)
+    p0, q0, p1, q1 = (np.where(go, p1, p0), np.where(go, q1, q0),
+                      np.where(go, p0 + a*p1, p1), np.where(go, a, q1))
+    nn, dd = n, np.where(go, r, n)
+    while go.any():
+        a = np.minimum(nn // np.where(go, dd, 1), max_denominator + 1)
+        q2 = q0 + a*q1
+        go &= q2 <= max_denominator
+        p0, q0, p1, q1 = (np.where(go, p1, p0), np.where(go, q1, q0),
+                          np.where(go, p0 + a*p1, p1), np.where(go, q2, q1))
+        nn, dd = np.where(go, dd, nn), np.where(go, nn - a*dd, dd)
+
+    k = (max_denominator - q0)//q1
+    p2, q2 = p0 + k*p1, q0 + k*q1
+    # p1/q1 is closer (or a tie) iff 2*dd*q2 <= 2**e
+    # i.e. dd <= 2**(e - 1)//q2 with dd < 2**53
+    lim, _ = _pow2_divmod(np.minimum(e - 1, 53 + 13), q2, 1 << 53)
+    lower = dd <= lim
+    num = np.where(lower, p1, p2)
+    den = np.where(lower, q1, q2)
+    num = np.where(exact, n, num)
+    den = np.where(exact, np.left_shift(1, np.minimum(e, 62)), den)
+    num = np.where(zero, 0, num)
+    den = np.where(zero, 1, den)
+    return num, den
 
 
 if __name__ == "__main__":
@@ -279,3 +819,10 @@ if __name__ == "__main__":
             0x000404B3,
             0x009C803C,
             0x00580005])])
+    print(a.decode_registers([
+            0x00640000,
+            0x08008009,
+            0x02004E42,
+            0x000404B3,
+            0x009C803C,
+            0x00580005])["frequency"])
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import sys
+import asyncio
+
+from .rack import Rack, parse_device
+from .metrics import add_metrics_args, start_metrics
+
+from sipyco.pc_rpc import Server
+
+from sipyco.common_args import (
+    simple_network_args, init_logger_from_args as init_logger,
+    bind_address_from_args, verbosity_args)
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        description="""PTB multi-device controller.
+
+        Each device is exposed as an RPC target under its name. Operations
+        on several devices are available on the `ptb_rack` target.""")
+    parser.add_argument(
+        "-d", "--device", default=[], action="append",
+        help="Device as `name=kind:host[:port]` or `name=kind:url` "
+             "(tcp://host[:port] or serial://port[?baudrate=115200]) "
+             "with kind one of synth, voltage, temp, shutter. Can be given "
+             "multiple times.")
+    add_metrics_args(parser)
+    simple_network_args(parser, 3270)
+    verbosity_args(parser)
+    return parser
+
+
+async def run(args):
+    specs = [parse_device(spec) for spec in args.device]
+    if any(spec[0] == "ptb_rack" for spec in specs):
+        raise ValueError("device name `ptb_rack` is reserved")
+    with await Rack.connect(specs) as rack:
+        metrics_server = await start_metrics(
+            rack.devices, args, bind_address_from_args(args))
+        targets = dict(rack.devices)
+        targets["ptb_rack"] = rack
+        server = Server(targets, None, True)
+        await server.start(bind_address_from_args(args), args.port)
+        try:
+            await server.wait_terminate()
+        finally:
+            await server.stop()
+            if metrics_server is not None:
+                metrics_server.close()
+
+
+def main():
+    args = get_argparser().parse_args()
+    init_logger(args)
+
+    if not args.device:
+        print("You need to supply at least one -d/--device "
+              "argument. Use --help for more information.")
+        sys.exit(1)
+
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(run(args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,14 @@
 import argparse
 import logging
 import sys
+import time
 import asyncio
 
 from .shutter_tcp import ShutterTCP as Shutter
+from .metrics import add_metrics_args, start_metrics
 
 from sipyco.pc_rpc import Server
+from sipyco.broadcast import Broadcaster
 from sipyco import common_args
 
 from sipyco.common_args import (
@@ -23,12 +26,52 @@ def get_argparser():
         description="""PTB shutter controller controller.""")
     parser.add_argument(
         "-d", "--device", default=None,
-        help="Device host name or IP address.")
+        help="Device host name, IP address or URL "
+             "(tcp://host[:port] or serial://port[?baudrate=115200]).")
+    parser.add_argument(
+        "--monitor-interval", default=None, type=float,
+        help="Poll the error flags every MONITOR_INTERVAL seconds and "
+             "broadcast changes (default: disabled).")
+    parser.add_argument(
+        "--auto-clear", default=False, action="store_true",
+        help="Clear errors as soon as the monitor detects them.")
+    parser.add_argument(
+        "--broadcast-port", default=3269, type=int,
+        help="TCP port to broadcast error flag changes on "
+             "(default: %(default)d).")
+    add_metrics_args(parser)
     simple_network_args(parser, 3268)
     verbosity_args(parser)
     return parser
 
 
+async def run(args):
+    with await Shutter.connect_url(args.device) as dev:
+        metrics_server = await start_metrics(
+            {"ptb_shutter": dev}, args, bind_address_from_args(args))
+        broadcaster = None
+        if args.monitor_interval is not None:
+            broadcaster = Broadcaster()
+            await broadcaster.start(bind_address_from_args(args),
+                                    args.broadcast_port)
+
+            def notify(status):
+                broadcaster.broadcast("ptb_shutter", {
+                    "time": time.time(), "status": status})
+            dev.start_monitor(args.monitor_interval, args.auto_clear,
+                              notify)
+        server = Server({"ptb_shutter": dev}, None, True)
+        await server.start(bind_address_from_args(args), args.port)
+        try:
+            await server.wait_terminate()
+        finally:
+            await server.stop()
+            if metrics_server is not None:
+                metrics_server.close()
+            if broadcaster is not None:
+                await broadcaster.stop()
+
+
 def main():
     args = get_argparser().parse_args()
     init_logger(args)
@@ -39,18 +82,8 @@ def main():
         sys.exit(1)
 
     loop = asyncio.get_event_loop()
-
-    async def run():
-        with await Shutter.connect(args.device, loop=loop) as dev:
-            server = Server({"ptb_shutter": dev}, None, True)
-            await server.start(bind_address_from_args(args), args.port)
-            try:
-                await server.wait_terminate()
-            finally:
-                await server.stop()
-
     try:
-        loop.run_until_complete(run())
+        loop.run_until_complete(run(args))
     except KeyboardInterrupt:
         pass
     finally:
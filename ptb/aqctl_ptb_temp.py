@@ -6,6 +6,7 @@ import sys
 import asyncio
 
 from .temp_tcp import TempTCP as Temp
+from .metrics import add_metrics_args, start_metrics
 
 from sipyco.pc_rpc import Server
 from sipyco import common_args
@@ -23,12 +24,34 @@ def get_argparser():
         description="""PTB temperature sensor controller.""")
     parser.add_argument(
         "-d", "--device", default=None,
-        help="Device host name or IP address.")
+        help="Device host name, IP address or URL "
+             "(tcp://host[:port] or serial://port[?baudrate=115200]).")
+    parser.add_argument(
+        "--sample-interval", default=None, type=float,
+        help="Sample all channels in the background every "
+             "SAMPLE_INTERVAL seconds (default: disabled).")
+    add_metrics_args(parser)
     simple_network_args(parser, 3266)
     verbosity_args(parser)
     return parser
 
 
+async def run(args):
+    with await Temp.connect_url(args.device) as dev:
+        metrics_server = await start_metrics(
+            {"ptb_temp": dev}, args, bind_address_from_args(args))
+        if args.sample_interval is not None:
+            dev.start_sampling(args.sample_interval)
+        server = Server({"ptb_temp": dev}, None, True)
+        await server.start(bind_address_from_args(args), args.port)
+        try:
+            await server.wait_terminate()
+        finally:
+            await server.stop()
+            if metrics_server is not None:
+                metrics_server.close()
+
+
 def main():
     args = get_argparser().parse_args()
     init_logger(args)
@@ -39,18 +62,8 @@ def main():
         sys.exit(1)
 
     loop = asyncio.get_event_loop()
-
-    async def run():
-        with await Temp.connect(args.device, loop=loop) as dev:
-            server = Server({"ptb_temp": dev}, None, True)
-            await server.start(bind_address_from_args(args), args.port)
-            try:
-                await server.wait_terminate()
-            finally:
-                await server.stop()
-
     try:
-        loop.run_until_complete(run())
+        loop.run_until_complete(run(args))
     except KeyboardInterrupt:
         pass
     finally:
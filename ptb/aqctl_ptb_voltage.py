@@ -6,6 +6,7 @@ import sys
 import asyncio
 
 from .voltage_tcp import VoltageTCP as Voltage
+from .metrics import add_metrics_args, start_metrics
 
 from sipyco.pc_rpc import Server
 from sipyco import common_args
@@ -23,12 +24,28 @@ def get_argparser():
         description="""PTB voltage/current source controller.""")
     parser.add_argument(
         "-d", "--device", default=None,
-        help="Device host name or IP address.")
+        help="Device host name, IP address or URL "
+             "(tcp://host[:port] or serial://port[?baudrate=115200]).")
+    add_metrics_args(parser)
     simple_network_args(parser, 3259)
     verbosity_args(parser)
     return parser
 
 
+async def run(args):
+    with await Voltage.connect_url(args.device) as dev:
+        metrics_server = await start_metrics(
+            {"ptb_voltage": dev}, args, bind_address_from_args(args))
+        server = Server({"ptb_voltage": dev}, None, True)
+        await server.start(bind_address_from_args(args), args.port)
+        try:
+            await server.wait_terminate()
+        finally:
+            await server.stop()
+            if metrics_server is not None:
+                metrics_server.close()
+
+
 def main():
     args = get_argparser().parse_args()
     init_logger(args)
@@ -39,18 +56,8 @@ def main():
         sys.exit(1)
 
     loop = asyncio.get_event_loop()
-
-    async def run():
-        with await Voltage.connect(args.device, loop=loop) as dev:
-            server = Server({"ptb_voltage": dev}, None, True)
-            await server.start(bind_address_from_args(args), args.port)
-            try:
-                await server.wait_terminate()
-            finally:
-                await server.stop()
-
     try:
-        loop.run_until_complete(run())
+        loop.run_until_complete(run(args))
     except KeyboardInterrupt:
         pass
     finally:
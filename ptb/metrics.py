@@ -0,0 +1,243 @@
+import bisect
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+
+def command_name(data):
+    """Return the first word of a command as its name."""
+    words = data.split(None, 1)
+    if not words:
+        return ""
+    return words[0].decode(errors="replace")
+
+
+class Metrics:
+    """Per-command counters and latency histograms.
+
+    Commands are grouped by name. For each name the number of commands,
+    the bytes sent and received, the number of errors and timeouts and a
+    histogram of the reply latencies are recorded.
+
+    Args:
+        name (callable): Returns the name of a command given its encoded
+            bytes. Defaults to :func:`command_name`.
+    """
+    # latency histogram bin edges in seconds
+    latency_bins = (1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2,
+                    .1, .2, .5, 1., 2., 5.)
+
+    def __init__(self, name=None):
+        self.name = name or command_name
+        self.clear()
+
+    def clear(self):
+        """Reset all counters."""
+        self._stats = {}
+
+    def _get(self, name):
+        try:
+            return self._stats[name]
+        except KeyError:
+            stats = {
+                "count": 0,
+                "bytes_out": 0,
+                "bytes_in": 0,
+                "errors": 0,
+                "timeouts": 0,
+                "latency_sum": 0.,
+                "latency_counts": [0]*(len(self.latency_bins) + 1),
+            }
+            self._stats[name] = stats
+            return stats
+
+    def record_command(self, name, n):
+        """Record a command of `n` bytes being sent."""
+        stats = self._get(name)
+        stats["count"] += 1
+        stats["bytes_out"] += n
+
+    def record_reply(self, name, n, latency):
+        """Record a reply of `n` bytes arriving `latency` seconds after
+        its command was sent."""
+        stats = self._get(name)
+        stats["bytes_in"] += n
+        stats["latency_sum"] += latency
+        stats["latency_counts"][
+            bisect.bisect(self.latency_bins, latency)] += 1
+
+    def record_error(self, name, exc):
+        """Record a failed command."""
+        stats = self._get(name)
+        if isinstance(exc, asyncio.TimeoutError):
+            stats["timeouts"] += 1
+        else:
+            stats["errors"] += 1
+
+    def get_stats(self):
+        """Return the recorded metrics.
+
+        Returns:
+            dict: Latency histogram bin edges in seconds (`bins`) and
+                the metrics per command name (`commands`): `count`,
+                `bytes_out`, `bytes_in`, `errors`, `timeouts`, the sum of
+                all reply latencies (`latency_sum`) and the latency
+                histogram (`latency_counts`, one more count than there
+                are edges).
+        """
+        return {
+            "bins": list(self.latency_bins),
+            "commands": {name: dict(stats, latency_counts=list(
+                stats["latency_counts"]))
+                for name, stats in self._stats.items()},
+        }
+
+    def prometheus(self, prefix="ptb", labels=None):
+        """Format the metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Metric name prefix.
+            labels (dict): Additional labels for all metrics.
+
+        Returns:
+            str: Metrics text.
+        """
+        return format_prometheus(self.get_stats(), prefix, labels)
+
+
+def _labels(labels):
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace(
+        "\\", "\\\\").replace('"', '\\"')) for k, v in labels) + "}"
+
+
+def format_prometheus(stats, prefix="ptb", labels=None):
+    """Format metrics from :meth:`Metrics.get_stats` in the Prometheus
+    text exposition format.
+
+    Args:
+        stats (dict): Metrics. `None` gives no metrics.
+        prefix (str): Metric name prefix.
+        labels (dict): Additional labels for all metrics.
+
+    Returns:
+        str: Metrics text.
+    """
+    return _format_prometheus([(labels, stats)], prefix)
+
+
+def _format_prometheus(series, prefix):
+    # series is a list of (labels, stats), each metric family is
+    # written once with the samples of all of them
+    series = [(sorted((labels or {}).items()), stats)
+              for labels, stats in series if stats is not None]
+    if not series:
+        return ""
+    series = [(labels, stats, sorted(stats["commands"].items()))
+              for labels, stats in series]
+    lines = []
+    counters = (
+        ("count", "commands_total", "Commands sent"),
+        ("bytes_out", "bytes_sent_total", "Bytes sent"),
+        ("bytes_in", "bytes_received_total", "Bytes received"),
+        ("errors", "errors_total", "Failed commands"),
+        ("timeouts", "timeouts_total", "Timed out commands"),
+    )
+    for key, name, doc in counters:
+        name = "{}_{}".format(prefix, name)
+        lines.append("# HELP {} {}".format(name, doc))
+        lines.append("# TYPE {} counter".format(name))
+        for labels, stats, commands in series:
+            for command, s in commands:
+                lines.append("{}{} {}".format(
+                    name, _labels(labels + [("command", command)]), s[key]))
+    name = "{}_latency_seconds".format(prefix)
+    lines.append("# HELP {} Reply latency".format(name))
+    lines.append("# TYPE {} histogram".format(name))
+    for labels, stats, commands in series:
+        for command, s in commands:
+            lab = labels + [("command", command)]
+            count = 0
+            for le, n in zip(stats["bins"] + ["+Inf"],
+                             s["latency_counts"]):
+                count += n
+                lines.append("{}_bucket{} {}".format(
+                    name, _labels(lab + [("le", le)]), count))
+            lines.append("{}_sum{} {}".format(name, _labels(lab),
+                                              s["latency_sum"]))
+            lines.append("{}_count{} {}".format(name, _labels(lab), count))
+    return "\n".join(lines) + "\n"
+
+
+async def serve_prometheus(collect, host, port):
+    """Serve metrics over HTTP for a Prometheus server to scrape.
+
+    Every request is answered with the current metrics, regardless of
+    its path.
+
+    Args:
+        collect (callable): Returns the metrics text.
+        host (str): Address to bind to.
+        port (int): Port to listen on.
+
+    Returns:
+        asyncio.AbstractServer: The server.
+    """
+    async def handle(reader, writer):
+        try:
+            while (await reader.readline()).strip():
+                pass  # request line and headers
+            body = collect().encode()
+            writer.write(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n" +
+                "Content-Length: {}\r\n\r\n".format(len(body)).encode() +
+                body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        except:
+            logger.warning("serving metrics failed", exc_info=True)
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
+
+
+def add_metrics_args(parser):
+    """Add the command line arguments of :func:`start_metrics` to a
+    controller argument parser."""
+    parser.add_argument(
+        "--metrics", default=False, action="store_true",
+        help="Record per-command metrics (see get_stats()).")
+    parser.add_argument(
+        "--metrics-port", default=None, type=int,
+        help="Serve the metrics in the Prometheus text format over HTTP "
+             "on this TCP port (implies --metrics, default: disabled).")
+
+
+async def start_metrics(devices, args, host):
+    """Enable metrics and serve them as requested on the command line
+    (see :func:`add_metrics_args`).
+
+    Args:
+        devices (dict): Devices (see
+            :meth:`ptb.transport.StreamDevice.enable_metrics`) by RPC
+            target name. The name is the `target` label of their metrics.
+        args (argparse.Namespace): Parsed command line arguments.
+        host (str): Address to bind the metrics server to.
+
+    Returns:
+        asyncio.AbstractServer: The metrics server, `None` if not serving.
+    """
+    if not args.metrics and args.metrics_port is None:
+        return None
+    for dev in devices.values():
+        dev.enable_metrics()
+    if args.metrics_port is None:
+        return None
+
+    def collect():
+        return _format_prometheus([
+            ({"target": name}, dev.get_stats())
+            for name, dev in sorted(devices.items())], "ptb")
+    return await serve_prometheus(collect, host, args.metrics_port)
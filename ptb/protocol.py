@@ -0,0 +1,78 @@
+import logging
+import asyncio
+
+from .metrics import command_name
+
+logger = logging.getLogger(__name__)
+
+
+class LineProtocol:
+    """Command and reply handling common to the PTB line protocols.
+
+    Subclasses implement the device commands on top of :meth:`do`,
+    :meth:`ask` and :meth:`read`. The I/O methods are provided by a
+    transport (see :class:`ptb.transport.StreamDevice`).
+
+    Commands may be `str` or `bytes`. Replies are decoded to `str` unless
+    :attr:`text` is `False`.
+    """
+    timeout = 2.  # reply deadline in seconds
+    max_cmd_len = None  # longest command in bytes, if limited
+    text = True  # decode replies
+
+    def do(self, cmd):
+        if self.max_cmd_len is not None:
+            assert len(cmd) <= self.max_cmd_len
+        logger.debug("do %s", cmd)
+        self._writeline(cmd)
+
+    async def ask(self, cmd, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        self.do(cmd)
+        ret = await self._readline(timeout)
+        logger.debug("ret %s", ret)
+        return ret
+
+    async def read(self, n, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        ret = await self._read(n, timeout)
+        if self.text:
+            ret = ret.decode()
+        return ret
+
+    async def version(self):
+        raise NotImplementedError
+
+    async def ping(self):
+        try:
+            await self.version()
+        except asyncio.CancelledError:
+            raise
+        except:
+            logger.warning("ping failed", exc_info=True)
+            return False
+        return True
+
+    def _command_name(self, data):
+        return command_name(data)
+
+    async def _restore(self):
+        # restore the device state after reconnecting
+        pass
+
+    def _writeline(self, cmd):
+        raise NotImplementedError
+
+    def _encode(self, cmd):
+        raise NotImplementedError
+
+    def _write(self, data):
+        raise NotImplementedError
+
+    async def _readline(self, timeout=None):
+        raise NotImplementedError
+
+    async def _read(self, n, timeout=None):
+        raise NotImplementedError
@@ -0,0 +1,191 @@
+import logging
+import asyncio
+import inspect
+
+from .synth_tcp import SynthTCP
+from .voltage_tcp import VoltageTCP
+from .temp_tcp import TempTCP
+from .shutter_tcp import ShutterTCP
+
+logger = logging.getLogger(__name__)
+
+
+kinds = {
+    "synth": SynthTCP,
+    "voltage": VoltageTCP,
+    "temp": TempTCP,
+    "shutter": ShutterTCP,
+}
+
+
+def parse_device(spec):
+    """Parse a device specification of the form `name=kind:host[:port]`
+    or `name=kind:url` (see
+    :meth:`ptb.transport.StreamDevice.connect_url`).
+
+    Returns:
+        tuple(str, str, str, int): Name, kind, host or URL and port.
+    """
+    name, _, rest = spec.partition("=")
+    kind, _, address = rest.partition(":")
+    if "://" in address:
+        host, port = address, None
+    else:
+        host, _, port = address.partition(":")
+    if not name or kind not in kinds or not host:
+        raise ValueError("invalid device specification `{}`".format(spec))
+    return name, kind, host, int(port) if port else 80
+
+
+class Rack:
+    """A set of PTB devices of mixed kinds sharing one event loop.
+
+    Operations on several devices run concurrently.
+
+    Args:
+        devices (dict): Devices by name.
+        kinds (dict): Device kind (see :data:`kinds`) by name.
+    """
+    # methods that :meth:`call` refuses, in addition to private ones
+    excluded_methods = {"close", "connect", "connect_serial", "connect_url"}
+
+    def __init__(self, devices, kinds):
+        self.devices = devices
+        self.kinds = kinds
+
+    @classmethod
+    async def connect(cls, specs, **kwargs):
+        """Connect to all devices concurrently.
+
+        If any device fails to connect, the others are closed again.
+
+        Args:
+            specs (list(tuple)): Name, kind, host or URL and port of each
+                device (see :func:`parse_device`).
+        """
+        specs = list(specs)
+        names = [spec[0] for spec in specs]
+        for name in names:
+            if names.count(name) > 1:
+                raise ValueError("duplicate device name `{}`".format(name))
+        devs = await asyncio.gather(*[
+            kinds[kind].connect_url(host, port, **kwargs)
+            for name, kind, host, port in specs], return_exceptions=True)
+        for dev in devs:
+            if isinstance(dev, BaseException):
+                for d in devs:
+                    if not isinstance(d, BaseException):
+                        d.close()
+                raise dev
+        return cls({spec[0]: dev for spec, dev in zip(specs, devs)},
+                   {spec[0]: spec[1] for spec in specs})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for dev in self.devices.values():
+            dev.close()
+
+    def get_devices(self, kind=None):
+        """Return the device names.
+
+        Args:
+            kind (str): Only return devices of this kind.
+
+        Returns:
+            list(str): Device names.
+        """
+        return [name for name, k in self.kinds.items()
+                if kind is None or k == kind]
+
+    async def call(self, method, *args, names=None, kind=None, **kwargs):
+        """Call a method on several devices concurrently.
+
+        Private methods and those in :attr:`excluded_methods` can not be
+        called.
+
+        Args:
+            method (str): Method name.
+            names (list(str)): Target devices. Defaults to all devices
+                of `kind`.
+            kind (str): Device kind. Defaults to all kinds.
+
+        Returns:
+            dict: Return values by device name.
+        """
+        if method.startswith("_") or method in self.excluded_methods:
+            raise ValueError("method `{}` can not be called".format(method))
+        if names is None:
+            names = self.get_devices(kind)
+
+        async def one(name):
+            ret = getattr(self.devices[name], method)(*args, **kwargs)
+            if inspect.isawaitable(ret):
+                ret = await ret
+            return ret
+        rets = await asyncio.gather(*[one(name) for name in names])
+        return dict(zip(names, rets))
+
+    async def ping(self):
+        """Ping all devices.
+
+        Returns:
+            dict: Ping result by device name.
+        """
+        return await self.call("ping")
+
+    async def set_frequency(self, frequency, names=None):
+        """Set the output frequency of several synthesizers and
+        start them concurrently.
+
+        Args:
+            frequency (float or dict): Frequency, or frequencies by name.
+            names (list(str)): Target synthesizers. Defaults to all or to
+                the keys of `frequency`.
+
+        Returns:
+            dict: Actual output frequency by name.
+        """
+        if isinstance(frequency, dict):
+            if names is None:
+                names = list(frequency)
+        else:
+            if names is None:
+                names = self.get_devices("synth")
+            frequency = {name: frequency for name in names}
+        f = {name: self.devices[name].set_frequency(frequency[name])
+             for name in names}
+        await self.call("start", names=names)
+        return f
+
+    async def locked(self, names=None):
+        """Return the lock status of several synthesizers.
+
+        Returns:
+            dict: Lock status by name.
+        """
+        return await self.call("locked", names=names, kind="synth")
+
+    async def ldac(self, names=None):
+        """Pulse LDAC on several voltage sources."""
+        await self.call("ldac", names=names, kind="voltage")
+
+    async def get_temperatures(self, names=None):
+        """Measure all channels of several temperature sensors.
+
+        Returns:
+            dict: Temperatures by name.
+        """
+        return await self.call("get_all", names=names, kind="temp")
+
+    async def status(self, names=None):
+        """Return the error flags of several shutter controllers.
+
+        Returns:
+            dict: Error flags by name.
+        """
+        return await self.call("status", names=names, kind="shutter")
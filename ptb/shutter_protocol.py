@@ -1,25 +1,26 @@
 import logging
 import asyncio
 
+from .protocol import LineProtocol
+
 logger = logging.getLogger(__name__)
 
 
-class ShutterProtocol:
+class ShutterProtocol(LineProtocol):
     """Protocol for the PTB multi-channel shutter controller"""
+    timeout = 2.  # reply deadline in seconds
+    max_cmd_len = 2
+    text = False  # replies are bytes
 
-    def do(self, cmd):
-        assert len(cmd) <= 2
-        logger.debug("do %s", cmd)
-        self._writeline(cmd)
+    def __init__(self):
+        self._monitor = None
+        self._status = None
 
-    async def ask(self, cmd, n=None):
-        self.do(cmd)
+    async def ask(self, cmd, n=None, timeout=None):
         if n is None:
-            ret = await self._readline()
-        else:
-            ret = await self._read(n)
-        logger.debug("ret %s", ret)
-        return ret
+            return await super().ask(cmd, timeout)
+        self.do(cmd)
+        return await self.read(n, timeout)
 
     async def version(self):
         """Return the hardware/firmware version.
@@ -29,16 +30,6 @@ class ShutterProtocol:
         """
         return (await self.ask(b"v")).strip()
 
-    async def ping(self):
-        try:
-            await self.version()
-        except asyncio.CancelledError:
-            raise
-        except:
-            logger.warning("ping failed", exc_info=True)
-            return False
-        return True
-
     async def status(self):
         """Return the error flags on all channels.
 
@@ -70,3 +61,55 @@ class ShutterProtocol:
             bytes: Response
         """
         return await self.ask(bytes(["{:d}".format(shutter).encode()[0], cmd]))
+
+    def start_monitor(self, interval=1., auto_clear=False, notify=None):
+        """Start polling the error flags in the background.
+
+        Args:
+            interval (float): Polling interval in seconds.
+            auto_clear (bool): Clear errors (see :meth:`clear`) as soon as
+                they are detected.
+            notify (callable): Called with the new error flags (see
+                :meth:`status`) whenever they change.
+        """
+        self.stop_monitor()
+        self._monitor = asyncio.ensure_future(
+            self._poll(interval, auto_clear, notify))
+
+    def stop_monitor(self):
+        """Stop the background error flag polling."""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+
+    def get_last_status(self):
+        """Return the error flags last seen by the monitor without
+        accessing the device.
+
+        Returns:
+            tuple(bool): Error flag on all channels or `None` if unknown.
+        """
+        return self._status
+
+    def _update(self, status, notify):
+        if status != self._status:
+            logger.info("status changed: %s", status)
+            self._status = status
+            if notify is not None:
+                notify(status)
+
+    async def _poll(self, interval, auto_clear, notify):
+        loop = asyncio.get_event_loop()
+        t_next = loop.time()
+        while True:
+            try:
+                status = await self.status()
+                self._update(status, notify)
+                if auto_clear and any(status):
+                    self._update(await self.clear(), notify)
+            except asyncio.CancelledError:
+                raise
+            except:
+                logger.warning("polling status failed", exc_info=True)
+            t_next = max(t_next + interval, loop.time())
+            await asyncio.sleep(t_next - loop.time())
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""Emulators of the PTB devices for testing and benchmarking the drivers
+without hardware.
+
+The emulators speak the line protocols (including the line terminators)
+of the devices over TCP or a pseudo terminal. Command latency, jitter
+and faults can be injected.
+"""
+
+import argparse
+import os
+import logging
+import asyncio
+import random
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Emulator:
+    """Base class of the device emulators.
+
+    Commands on a connection are handled one after the other, like on the
+    device. Before replying, each command is delayed by its latency plus a
+    uniformly distributed random jitter.
+
+    Args:
+        latency (float): Delay of each reply in seconds.
+        jitter (float): Maximum additional random delay in seconds.
+        latencies (dict): Latency per command name, overriding `latency`.
+        drop_rate (float): Probability of not replying to a command.
+        garble_rate (float): Probability of corrupting a reply.
+        disconnect_rate (float): Probability of closing the connection
+            instead of replying.
+        seed (int): Seed of the random number generator used for jitter
+            and faults.
+    """
+    eol_read = b"\n"  # terminator of commands
+    eol_write = b"\n"  # terminator of replies
+
+    def __init__(self, latency=0., jitter=0., latencies=None, drop_rate=0.,
+                 garble_rate=0., disconnect_rate=0., seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.latencies = dict(latencies or {})
+        self.drop_rate = drop_rate
+        self.garble_rate = garble_rate
+        self.disconnect_rate = disconnect_rate
+        self._rng = random.Random(seed)
+        self.counts = {}
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving.
+
+        Args:
+            host (str): Address to bind to.
+            port (int): Port to listen on. `0` picks a free port.
+
+        Returns:
+            asyncio.AbstractServer: The server. The actual address is in
+                `server.sockets[0].getsockname()`.
+        """
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def start_pty(self):
+        """Serve on a new pseudo terminal to test serial connections.
+
+        Returns:
+            str: Path of the terminal device for the driver to open
+                (e.g. with :meth:`ptb.transport.StreamDevice.connect_serial`).
+        """
+        master, slave = os.openpty()
+        loop = asyncio.get_event_loop()
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            os.fdopen(master, "rb", 0, closefd=False))
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, os.fdopen(master, "wb", 0))
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        # the event loop only keeps weak references to tasks
+        self._pty_task = asyncio.ensure_future(self._handle(reader, writer))
+        # keep the slave open so that the master does not see a hangup
+        # while no driver has it open
+        self._pty_slave = slave
+        return os.ttyname(slave)
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        logger.info("%s connected", peer)
+        try:
+            while True:
+                try:
+                    cmd = await reader.readuntil(self.eol_read)
+                except asyncio.IncompleteReadError:
+                    break
+                cmd = cmd[:-len(self.eol_read)]
+                name = self.command_name(cmd)
+                self.counts[name] = self.counts.get(name, 0) + 1
+                delay = self.latencies.get(name, self.latency)
+                if self.jitter:
+                    delay += self._rng.uniform(0, self.jitter)
+                if delay:
+                    await asyncio.sleep(delay)
+                if self._rng.random() < self.disconnect_rate:
+                    logger.info("injecting disconnect on %r", cmd)
+                    break
+                ret = self.reply(cmd)
+                if ret is None:
+                    continue
+                if self._rng.random() < self.drop_rate:
+                    logger.info("injecting dropped reply to %r", cmd)
+                    continue
+                if ret and self._rng.random() < self.garble_rate:
+                    logger.info("injecting garbled reply to %r", cmd)
+                    ret = bytes(self._rng.randrange(32, 127)
+                                for _ in range(len(ret)))
+                writer.write(ret)
+        except ConnectionError:
+            pass
+        finally:
+            logger.info("%s disconnected", peer)
+            writer.close()
+
+    def command_name(self, cmd):
+        """Return the name of a command used to look up its latency."""
+        return cmd.split(b" ", 1)[0].decode(errors="replace")
+
+    def reply(self, cmd):
+        """Handle a command.
+
+        Args:
+            cmd (bytes): Command without terminator.
+
+        Returns:
+            bytes: Reply including its terminator, or `None` for no reply.
+        """
+        raise NotImplementedError
+
+
+class SynthEmulator(Emulator):
+    """Synthesizer emulator.
+
+    The PLL reports lock `lock_time` seconds after the last `start`.
+    """
+    lock_time = 1e-3
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.regs = None
+        self.eeprom = None
+        self._t_lock = 0.
+
+    def command_name(self, cmd):
+        for name in (b"start", b"save"):
+            if cmd.startswith(name):
+                return name.decode()
+        return super().command_name(cmd)
+
+    def reply(self, cmd):
+        if cmd == b"version":
+            return b"ptb 1.0"
+        if cmd == b"locked":
+            if time.monotonic() < self._t_lock:
+                return b"not locked" + self.eol_write
+            return b"locked" + self.eol_write
+        for name in (b"start", b"save "):
+            if cmd.startswith(name):
+                try:
+                    regs = self._parse_regs(cmd[len(name):])
+                except ValueError:
+                    return b"err\n"
+                if name == b"start":
+                    self.regs = regs
+                    self._t_lock = time.monotonic() + self.lock_time
+                else:
+                    self.eeprom = regs
+                return b"ok\r\n"
+        return b"err\n"
+
+    def _parse_regs(self, data):
+        if len(data) != 6*8:
+            raise ValueError("invalid register data")
+        return [int(data[i:i + 8], 16) for i in range(0, len(data), 8)]
+
+
+class VoltageEmulator(Emulator):
+    """Voltage source emulator.
+
+    The DAC value of a channel is computed from its voltage, gain and
+    offset as `32768 + offset + gain*voltage`, clamped to 16 bits.
+
+    Args:
+        channels (int): Number of channels.
+    """
+    default_gain = 2**16/20.
+
+    def __init__(self, channels=8, **kwargs):
+        super().__init__(**kwargs)
+        self.channels = channels
+        self.gain = [self.default_gain]*channels
+        self.offset = [0]*channels
+        self.data = [0x8000]*channels
+        self.active = list(self.data)
+
+    def command_name(self, cmd):
+        return " ".join(cmd.decode(errors="replace").split()[:2])
+
+    def reply(self, cmd):
+        try:
+            ret = self._reply(cmd.decode().split())
+        except (ValueError, IndexError):
+            ret = "error"
+        return ret.encode() + self.eol_write
+
+    def _reply(self, v):
+        action, name, args = v[0], v[1], v[2:]
+        cmd = "{} {}".format(action, name)
+        if cmd == "get version":
+            return cmd + " ptb-voltage 1.0"
+        if cmd == "get temp":
+            return cmd + " 2048 2048"
+        if cmd == "set ldac":
+            self.active = list(self.data)
+            return cmd
+        if cmd == "set factory":
+            self.gain = [self.default_gain]*self.channels
+            self.offset = [0]*self.channels
+            return cmd
+        if action not in ("get", "set") or name not in (
+                "volt", "gain", "offset", "data"):
+            raise ValueError(cmd)
+        n = int(args[0])
+        if len(args) != 2*n + 1:
+            raise ValueError(cmd)
+        ret = [cmd, str(n)]
+        for channel, value in zip(args[1::2], args[2::2]):
+            i = int(channel) - 1
+            if not 0 <= i < self.channels:
+                raise ValueError(channel)
+            if action == "set":
+                value = self._set(name, i, value)
+            else:
+                value = self._get(name, i)
+            ret.extend((channel, value))
+        return " ".join(ret)
+
+    def _set(self, name, i, value):
+        if name == "volt":
+            data = int(round(32768 + self.offset[i] +
+                             self.gain[i]*float(value)))
+            self.data[i] = min(max(data, 0), 0xffff)
+            return "{:.4f}".format(float(value))
+        if name == "gain":
+            self.gain[i] = float(value)
+            return "{:.4f}".format(self.gain[i])
+        if name == "offset":
+            self.offset[i] = int(value)
+            return "{:d}".format(self.offset[i])
+        self.data[i] = min(max(int(value), 0), 0xffff)
+        return "{:d}".format(self.data[i])
+
+    def _get(self, name, i):
+        if name == "volt":
+            return "{:.4f}".format(
+                (self.data[i] - 32768 - self.offset[i])/self.gain[i])
+        if name == "gain":
+            return "{:.4f}".format(self.gain[i])
+        if name == "offset":
+            return "{:d}".format(self.offset[i])
+        return "{:d}".format(self.data[i])
+
+
+class TempEmulator(Emulator):
+    """Temperature sensor emulator.
+
+    Temperatures are `temperature` plus uniformly distributed noise of
+    `noise` amplitude.
+
+    Args:
+        channels (int): Number of channels.
+    """
+    eol_read = b"\r"
+    eol_write = b"\r\n"
+    temperature = 21.
+    noise = .01
+
+    def __init__(self, channels=8, **kwargs):
+        super().__init__(**kwargs)
+        self.channels = channels
+
+    def _temp(self, channel):
+        return "{:d}:{:.3f}".format(
+            channel, self.temperature + self._rng.uniform(0, self.noise))
+
+    def reply(self, cmd):
+        if cmd == b"v":
+            ret = "ptb-temp 1.0"
+        elif cmd == b"a":
+            ret = " ".join(self._temp(i) for i in range(self.channels))
+        elif cmd.isdigit() and int(cmd) < self.channels:
+            ret = self._temp(int(cmd))
+        else:
+            ret = "error"
+        return ret.encode() + self.eol_write
+
+
+class ShutterEmulator(Emulator):
+    """Shutter driver emulator.
+
+    Each `e` (status) command raises the error flag of a random channel
+    with probability `error_rate`.
+
+    Args:
+        channels (int): Number of channels.
+        error_rate (float): Probability of an error per status command.
+    """
+    eol_read = b"\r\n"
+    eol_write = b"\r\n"
+
+    def __init__(self, channels=3, error_rate=0., **kwargs):
+        super().__init__(**kwargs)
+        self.error_rate = error_rate
+        self.errors = [False]*channels
+
+    def command_name(self, cmd):
+        return cmd[-1:].decode(errors="replace")
+
+    def _flags(self):
+        return "".join("1" if e else "0" for e in self.errors)
+
+    def reply(self, cmd):
+        if cmd == b"v":
+            ret = "ptb-shutter 1.0"
+        elif cmd == b"e":
+            if self._rng.random() < self.error_rate:
+                self.errors[self._rng.randrange(len(self.errors))] = True
+            ret = self._flags()
+        elif cmd == b"r":
+            self.errors = [False]*len(self.errors)
+            ret = self._flags()
+        elif (len(cmd) == 2 and cmd[:1].isdigit() and
+                1 <= int(cmd[:1]) <= len(self.errors)):
+            ret = "{}{}".format(int(cmd[:1]), cmd[1:].decode())
+        else:
+            ret = "error"
+        return ret.encode() + self.eol_write
+
+
+emulators = {
+    "synth": SynthEmulator,
+    "voltage": VoltageEmulator,
+    "temp": TempEmulator,
+    "shutter": ShutterEmulator,
+}
+
+
+def get_argparser():
+    from sipyco.common_args import verbosity_args
+
+    parser = argparse.ArgumentParser(
+        description="""PTB device emulators.""")
+    parser.add_argument(
+        "devices", nargs="+", metavar="KIND:PORT",
+        help="Emulator to start, KIND is one of {}. If PORT is `pty`, "
+             "the emulator serves on a new pseudo terminal.".format(
+            ", ".join(sorted(emulators))))
+    parser.add_argument(
+        "--bind", default="127.0.0.1",
+        help="Address to listen on (default: %(default)s).")
+    parser.add_argument(
+        "--latency", type=float, default=0.,
+        help="Reply latency in seconds (default: %(default)g).")
+    parser.add_argument(
+        "--jitter", type=float, default=0.,
+        help="Maximum additional random latency in seconds "
+             "(default: %(default)g).")
+    parser.add_argument(
+        "--drop-rate", type=float, default=0.,
+        help="Probability of dropping a reply (default: %(default)g).")
+    parser.add_argument(
+        "--garble-rate", type=float, default=0.,
+        help="Probability of garbling a reply (default: %(default)g).")
+    parser.add_argument(
+        "--disconnect-rate", type=float, default=0.,
+        help="Probability of disconnecting instead of replying "
+             "(default: %(default)g).")
+    parser.add_argument(
+        "--seed", type=int, default=None,
+        help="Random number generator seed.")
+    verbosity_args(parser)
+    return parser
+
+
+def main():
+    from sipyco.common_args import init_logger_from_args
+
+    args = get_argparser().parse_args()
+    init_logger_from_args(args)
+
+    loop = asyncio.get_event_loop()
+    servers = []
+    for device in args.devices:
+        kind, _, port = device.partition(":")
+        if kind not in emulators or not (port.isdigit() or port == "pty"):
+            raise ValueError("invalid emulator `{}`".format(device))
+        emulator = emulators[kind](
+            latency=args.latency, jitter=args.jitter,
+            drop_rate=args.drop_rate, garble_rate=args.garble_rate,
+            disconnect_rate=args.disconnect_rate, seed=args.seed)
+        if port == "pty":
+            path = loop.run_until_complete(emulator.start_pty())
+            print("{} emulator on serial://{}".format(kind, path))
+            continue
+        server = loop.run_until_complete(
+            emulator.start(args.bind, int(port)))
+        logger.info("%s emulator listening on %s", kind,
+                    server.sockets[0].getsockname())
+        servers.append(server)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
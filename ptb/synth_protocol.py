@@ -1,29 +1,37 @@
 import logging
 import asyncio
+import bisect
 
 from .adf4350 import ADF4350
+from .metrics import command_name
+from .protocol import LineProtocol
 
 logger = logging.getLogger(__name__)
 
 
-class SynthProtocol(ADF4350):
+class SynthProtocol(ADF4350, LineProtocol):
     """Protocol for the PTB synthesizer (ADF4350-based)"""
     poll_interval = .01
+    poll_interval_max = .1
+    timeout = 2.  # reply deadline in seconds
+    max_cmd_len = 63
+    # lock time histogram bin edges in seconds and frequency band width in Hz
+    lock_time_bins = (1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, .1, .2, .5, 1.)
+    lock_band_width = 100e6
 
-    def do(self, cmd):
-        assert len(cmd) < 64
-        logger.debug("do %s", cmd)
-        self._writeline(cmd)
+    def __init__(self):
+        super().__init__()
+        # register values (reg5 down to reg0) last acknowledged by the device
+        self._regs_ack = None
+        self._lock_times = {}
+        # named tables of pre-encoded start commands and their registers
+        self._hop_tables = {}
 
-    async def ask(self, cmd):
-        self.do(cmd)
-        ret = await self._readline()
-        logger.debug("ret %s", ret)
-        return ret
-
-    async def read(self, n):
-        ret = await self._read(n)
-        return ret.decode()
+    def _command_name(self, data):
+        # register data follows start without a separator
+        if data.startswith(b"start"):
+            return "start"
+        return command_name(data)
 
     def set(self, **kwargs):
         """Configure synthesizer settings.
@@ -33,11 +41,16 @@ class SynthProtocol(ADF4350):
         This does not update the synthesizer settings or registers.
         This method only sets instance attributes that affect the
         calculation of register values during :meth:`set_frequency`.
+        Changing any of them invalidates the frequency plan cache.
         """
+        changed = False
         for k, v in kwargs.items():
             if not hasattr(self, k):
                 raise ValueError("No such field `{}`".format(k))
+            changed |= getattr(self, k) != v
             setattr(self, k, v)
+        if changed:
+            self.clear_plan_cache()
 
     def get(self, key):
         """Get a synthesizer configuration setting (instance attribute)."""
@@ -55,22 +68,110 @@ class SynthProtocol(ADF4350):
     def _fmt_regs(self, regs):
         return "{:08x}{:08x}{:08x}{:08x}{:08x}{:08x}".format(*regs)
 
-    async def start(self, regs=None):
+    def _frequency_regs(self):
+        # registers calculated by set_frequency(), reg5 down to reg0
+        if self._regs is None:
+            raise ValueError("no frequency set")
+        return reversed(self._regs)
+
+    def get_registers(self):
+        """Return the register values last acknowledged by the synthesizer.
+
+        Returns:
+            list(int): 32 bit register values (reg5 down to reg0) or `None`
+                if unknown.
+        """
+        return self._regs_ack
+
+    async def start(self, regs=None, delta=False):
         """Send the six registers to the synthesizer.
 
+        The firmware only accepts complete register sets. In delta mode
+        nothing is sent if the registers are identical to the ones last
+        acknowledged by the device.
+
         Args:
             regs (list(int), optional): 32 bit register values
                 (reg5 down to reg0). If no register values are passed, then
                 the ones calculated by :meth:`set_frequency` are used.
+            delta (bool): Skip the transfer if no register has changed.
+
+        Returns:
+            bool: Whether the registers were sent.
         """
         if regs is None:
-            regs = reversed(self._regs)
+            regs = self._frequency_regs()
+        regs = list(regs)
+        if delta and regs == self._regs_ack:
+            return False
         cmd = "start{}".format(self._fmt_regs(regs))
         assert len(cmd) == 5 + 6*8
+        self._regs_ack = None
         self.do(cmd)
         ret = (await self.read(4)).strip()
         if ret != "ok":
             raise ValueError("start failed", ret)
+        self._regs_ack = regs
+        return True
+
+    async def _restore(self):
+        # replay the last acknowledged registers after reconnecting
+        if self._regs_ack is not None:
+            await self.start(self._regs_ack)
+
+    def build_hop_table(self, name, frequencies):
+        """Compute and encode the registers for a list of frequencies.
+
+        All frequencies are validated and the complete `start` commands are
+        encoded up front so that :meth:`hop` only needs to send them.
+        The table is computed with the current configuration (see
+        :meth:`set`) and is not updated if it changes.
+
+        Args:
+            name (str): Table name. Replaces an existing table.
+            frequencies (list(float)): Output frequencies.
+
+        Returns:
+            list(float): Actual output frequencies.
+        """
+        regs, f, _ = self.plan_frequencies(frequencies)
+        table = []
+        for r in regs[:, ::-1].tolist():
+            cmd = "start{}".format(self._fmt_regs(r))
+            table.append((self._encode(cmd), r))
+        self._hop_tables[name] = table
+        return f.tolist()
+
+    def delete_hop_table(self, name):
+        """Delete a table created by :meth:`build_hop_table`."""
+        del self._hop_tables[name]
+
+    async def hop(self, name, index):
+        """Send a precomputed register set from a table created by
+        :meth:`build_hop_table`.
+
+        Args:
+            name (str): Table name.
+            index (int): Table entry.
+        """
+        data, regs = self._hop_tables[name][index]
+        self._regs_ack = None
+        self._write(data)
+        ret = await self._read(4, self.timeout)
+        if ret.strip() != b"ok":
+            raise ValueError("start failed", ret)
+        self._regs_ack = regs
+
+    async def play_hops(self, name, indices):
+        """Send a sequence of precomputed register sets, each as soon
+        as the previous one has been acknowledged.
+
+        Args:
+            name (str): Table name.
+            indices (list(int)): Table entries.
+        """
+        for index in indices:
+            await self.hop(name, index)
 
     async def save(self, regs=None):
         """Save the six registers to the EEPROM.
@@ -82,11 +183,11 @@ class SynthProtocol(ADF4350):
                 the ones calculated by :meth:`set_frequency` are used.
         """
         if regs is None:
-            regs = reversed(self._regs)
+            regs = self._frequency_regs()
         cmd = "save {}".format(self._fmt_regs(regs))
         assert len(cmd) == 5 + 6*8
         self.do(cmd)
-        ret = await self.read(4).strip()
+        ret = (await self.read(4)).strip()
         if ret != "ok":
             raise ValueError("save failed", ret)
 
@@ -98,18 +199,64 @@ class SynthProtocol(ADF4350):
         """
         return not "not" in await self.ask("locked")
 
-    def _writeline(self, cmd):
-        raise NotImplemented
+    async def start_and_wait_locked(self, regs=None, timeout=1.):
+        """Send the registers and wait for the PLL to lock.
 
-    async def _readline(self):
-        raise NotImplemented
+        The lock status is polled with an interval starting at
+        :attr:`poll_interval` and doubling up to :attr:`poll_interval_max`.
+        Lock times are recorded in a histogram per output frequency band
+        (see :meth:`get_lock_histogram`).
+
+        Args:
+            regs (list(int), optional): See :meth:`start`.
+            timeout (float): Maximum time to wait for lock in seconds.
 
-    async def ping(self):
+        Returns:
+            float: Time from the acknowledgement of the registers
+                until lock was detected in seconds.
+        """
+        band = None
+        if regs is None:
+            regs = self._frequency_regs()
+            band = int(self._frequency // self.lock_band_width *
+                       self.lock_band_width)
+        await self.start(regs)
+        loop = asyncio.get_event_loop()
+        t0 = loop.time()
+        interval = self.poll_interval
+        while not await self.locked():
+            remaining = t0 + timeout - loop.time()
+            if remaining <= 0:
+                self._record_lock_time(band, float("inf"))
+                raise asyncio.TimeoutError("PLL did not lock")
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(2*interval, self.poll_interval_max)
+        t = loop.time() - t0
+        self._record_lock_time(band, t)
+        return t
+
+    def _record_lock_time(self, band, t):
         try:
-            await self.version()
-        except asyncio.CancelledError:
-            raise
-        except:
-            logger.warning("ping failed", exc_info=True)
-            return False
-        return True
+            counts = self._lock_times[band]
+        except KeyError:
+            counts = [0]*(len(self.lock_time_bins) + 1)
+            self._lock_times[band] = counts
+        counts[bisect.bisect(self.lock_time_bins, t)] += 1
+
+    def get_lock_histogram(self):
+        """Return the lock time histograms recorded by
+        :meth:`start_and_wait_locked`.
+
+        Returns:
+            dict: Bin edges in seconds (`bins`) and counts per frequency
+                band (`bands`). The bands are keyed by their lower edge in
+                Hz (`None` for explicitly passed registers). There is one
+                more count than there are edges: the first counts lock
+                times below the first edge and the last those above the
+                last edge, including timeouts.
+        """
+        return {
+            "bins": list(self.lock_time_bins),
+            "bands": {band: list(counts)
+                      for band, counts in self._lock_times.items()},
+        }
@@ -1,26 +1,25 @@
 import logging
 import asyncio
+import time
 
-logger = logging.getLogger(__name__)
+import numpy as np
 
+from .protocol import LineProtocol
 
-class TempProtocol:
-    """Protocol for the PTB multi-channel temperature sensor"""
+logger = logging.getLogger(__name__)
 
-    def do(self, cmd):
-        assert len(cmd) < 64
-        logger.debug("do %s", cmd)
-        self._writeline(cmd)
 
-    async def ask(self, cmd):
-        self.do(cmd)
-        ret = await self._readline()
-        logger.debug("ret %s", ret)
-        return ret
+class TempProtocol(LineProtocol):
+    """Protocol for the PTB multi-channel temperature sensor"""
+    timeout = 10.  # reply deadline in seconds, includes the measurement
+    max_cmd_len = 63
+    history_length = 3600  # number of samples kept by the background sampler
 
-    async def read(self, n):
-        ret = await self._read(n)
-        return ret.decode()
+    def __init__(self):
+        self._sampler = None
+        self._times = None
+        self._samples = None
+        self._count = 0
 
     async def version(self):
         """Return the hardware/firmware version.
@@ -58,18 +57,106 @@ class TempProtocol:
         assert int(ch) == channel
         return float(temp)
 
-    def _writeline(self, cmd):
-        raise NotImplemented
-
-    async def _readline(self):
-        raise NotImplemented
-
-    async def ping(self):
-        try:
-            await self.version()
-        except asyncio.CancelledError:
-            raise
-        except:
-            logger.warning("ping failed", exc_info=True)
-            return False
-        return True
+    def start_sampling(self, interval=1.):
+        """Start measuring all channels periodically in the background.
+
+        The samples are kept in a ring buffer of :attr:`history_length`
+        entries and can be retrieved without accessing the device
+        using :meth:`get_latest`, :meth:`get_history` and
+        :meth:`get_aggregates`.
+
+        Args:
+            interval (float): Sampling interval in seconds.
+        """
+        self.stop_sampling()
+        self._sampler = asyncio.ensure_future(self._sample(interval))
+
+    def stop_sampling(self):
+        """Stop the background sampler."""
+        if self._sampler is not None:
+            self._sampler.cancel()
+            self._sampler = None
+
+    async def _sample(self, interval):
+        loop = asyncio.get_event_loop()
+        t_next = loop.time()
+        while True:
+            try:
+                t = await self.get_all()
+            except asyncio.CancelledError:
+                raise
+            except:
+                logger.warning("sampling failed", exc_info=True)
+            else:
+                self._store(time.time(), t)
+            t_next = max(t_next + interval, loop.time())
+            await asyncio.sleep(t_next - loop.time())
+
+    def _store(self, timestamp, t):
+        if self._samples is None or self._samples.shape[1] != len(t):
+            self._times = np.empty(self.history_length)
+            self._samples = np.empty((self.history_length, len(t)))
+            self._count = 0
+        i = self._count % len(self._times)
+        self._times[i] = timestamp
+        self._samples[i] = t
+        self._count += 1
+
+    def _window(self, duration):
+        if not self._count:
+            return np.empty(0), np.empty((0, 0))
+        n = len(self._times)
+        i = self._count % n
+        idx = np.arange(i - min(self._count, n), i) % n
+        times, samples = self._times[idx], self._samples[idx]
+        if duration is not None:
+            keep = times >= time.time() - duration
+            times, samples = times[keep], samples[keep]
+        return times, samples
+
+    def get_latest(self):
+        """Return the latest background sample.
+
+        Returns:
+            tuple(float, list(float)): Timestamp (seconds since epoch) and
+                temperatures on all channels. `None` if there are no
+                samples.
+        """
+        if not self._count:
+            return None
+        i = (self._count - 1) % len(self._times)
+        return float(self._times[i]), self._samples[i].tolist()
+
+    def get_history(self, duration=None):
+        """Return background samples.
+
+        Args:
+            duration (float): Only return samples taken within the last
+                `duration` seconds. Defaults to all samples kept.
+
+        Returns:
+            tuple(array, array): Timestamps (seconds since epoch), shape
+                (N,), and temperatures, shape (N, channels), oldest first.
+        """
+        return self._window(duration)
+
+    def get_aggregates(self, duration=None):
+        """Return per-channel statistics of the background samples.
+
+        Args:
+            duration (float): Only use samples taken within the last
+                `duration` seconds. Defaults to all samples kept.
+
+        Returns:
+            dict: Number of samples `n` and per-channel `min`, `max` and
+                `mean` temperatures (lists), `None` if there are no samples.
+        """
+        times, samples = self._window(duration)
+        if not len(times):
+            return None
+        return {
+            "n": len(times),
+            "min": samples.min(axis=0).tolist(),
+            "max": samples.max(axis=0).tolist(),
+            "mean": samples.mean(axis=0).tolist(),
+        }
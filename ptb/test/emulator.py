@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+
+from ptb import sim
+
+
+class EmulatorCase(unittest.TestCase):
+    """Test case running a device emulator of :attr:`kind` on an event
+    loop of its own with a :attr:`driver` instance connected to it as
+    `self.dev`."""
+    kind = None
+    driver = None
+    timeout = 10.  # limit of each run_async() in seconds
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.emulator = sim.emulators[self.kind](seed=0)
+        self.server = None
+        self.dev = self.run_async(self.connect())
+
+    async def connect(self):
+        """Start serving and return the connected driver."""
+        self.server = await self.emulator.start()
+        port = self.server.sockets[0].getsockname()[1]
+        return await self.driver.connect("127.0.0.1", port)
+
+    def tearDown(self):
+        self.dev.close()
+        if self.server is not None:
+            self.server.close()
+            self.run_async(self.server.wait_closed())
+        tasks = [t for t in asyncio.all_tasks(self.loop) if not t.done()]
+        for t in tasks:
+            t.cancel()
+        self.run_async(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_async(self, coro, timeout=None):
+        return self.loop.run_until_complete(
+            asyncio.wait_for(coro, timeout or self.timeout))
+
+    def sleep(self, delay):
+        self.run_async(asyncio.sleep(delay))
+
+    def wait_for(self, predicate, timeout=2., interval=.01):
+        """Run the event loop until `predicate()` is true."""
+        async def poll():
+            while not predicate():
+                await asyncio.sleep(interval)
+        self.run_async(poll(), timeout)
@@ -0,0 +1,175 @@
+import unittest
+
+import numpy as np
+
+from ptb.adf4350 import ADF4350
+from ptb.synth_protocol import SynthProtocol
+
+
+class ADF4350Case(unittest.TestCase):
+    configs = [
+        dict(ref_frequency=100e6, ref_div_factor=4),
+        dict(ref_frequency=10e6, ref_div_factor=1, ref_doubler_en=True),
+        dict(ref_frequency=100e6, ref_div_factor=5, channel_spacing=1e5,
+             lock_detect_function_integer_n_en=False),
+    ]
+
+    def frequencies(self, n=200):
+        rng = np.random.RandomState(0)
+        f = rng.uniform(ADF4350.min_out_freq, ADF4350.max_out_freq, n)
+        return np.concatenate([
+            f, [ADF4350.min_out_freq, ADF4350.max_out_freq, 2.2e9,
+                ADF4350.max_freq_45_presc, 2.05e9]])
+
+    def make(self, **config):
+        dev = ADF4350()
+        for k, v in config.items():
+            setattr(dev, k, v)
+        return dev
+
+    def test_plan_cache(self):
+        dev = self.make(**self.configs[0])
+        f = dev.set_frequency(2.05e9)
+        regs = list(dev._regs)
+        dev.set_frequency(2.1e9)
+        self.assertEqual(dev.set_frequency(2.05e9), f)
+        self.assertEqual(dev._regs, regs)
+        stats = dev.get_plan_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]),
+                         (1, 2, 2))
+
+    def test_plan_cache_eviction(self):
+        dev = self.make(**self.configs[0])
+        dev.plan_cache_size = 3
+        for f in (2.0e9, 2.1e9, 2.2e9):
+            dev.set_frequency(f)
+        dev.set_frequency(2.0e9)  # now most recently used
+        dev.set_frequency(2.3e9)  # evicts 2.1e9
+        self.assertEqual(dev.get_plan_cache_stats()["size"], 3)
+        dev.set_frequency(2.0e9)
+        self.assertEqual(dev.get_plan_cache_stats()["hits"], 2)
+        dev.set_frequency(2.1e9)
+        self.assertEqual(dev.get_plan_cache_stats()["misses"], 5)
+
+    def test_plan_cache_invalidation(self):
+        dev = SynthProtocol()
+        dev.set(ref_frequency=100e6, ref_div_factor=4)
+        dev.set_frequency(2.05e9)
+        regs = list(dev._regs)
+        dev.set(ref_div_factor=4)  # unchanged
+        self.assertEqual(dev.get_plan_cache_stats()["size"], 1)
+        dev.set(output_power=0)
+        self.assertEqual(dev.get_plan_cache_stats()["size"], 0)
+        dev.set_frequency(2.05e9)
+        self.assertNotEqual(dev._regs, regs)
+        self.assertEqual(dev.get_plan_cache_stats()["misses"], 2)
+        # attributes changed directly are part of the cache key
+        dev.output_power = 3
+        dev.set_frequency(2.05e9)
+        self.assertEqual(dev._regs, regs)
+        self.assertEqual(dev.get_plan_cache_stats()["misses"], 3)
+
+    def test_plan_frequencies_bit_identical(self):
+        f_out = self.frequencies()
+        for config in self.configs:
+            with self.subTest(**config):
+                dev = self.make(**config)
+                regs, f, err = dev.plan_frequencies(f_out)
+                self.assertEqual(regs.shape, (len(f_out), 6))
+                self.assertEqual(regs.dtype, np.uint32)
+                for i, fi in enumerate(f_out):
+                    f_scalar = dev.set_frequency(float(fi))
+                    self.assertEqual(regs[i].tolist(), dev._regs)
+                    self.assertEqual(f[i], f_scalar)
+                    self.assertEqual(err[i], f_scalar - fi)
+
+    def test_plan_frequencies_no_side_effects(self):
+        dev = self.make(**self.configs[0])
+        dev.plan_frequencies(self.frequencies(10))
+        self.assertIsNone(dev.get_frequency_plan())
+        self.assertEqual(dev.get_plan_cache_stats()["size"], 0)
+
+    def test_plan_frequencies_invalid(self):
+        dev = self.make(**self.configs[0])
+        with self.assertRaises(ValueError):
+            dev.plan_frequencies([1e9, 5e9])
+        with self.assertRaises(ValueError):
+            dev.plan_frequencies([[1e9]])
+
+    def test_search_apply_plan(self):
+        dev = self.make(**self.configs[0])
+        f_out = 2.05e9 + 1234.5
+        plan = dev.search_plan(f_out)
+        self.assertEqual(abs(plan["error"]), plan["error_min"])
+        self.assertAlmostEqual(plan["frequency"], f_out + plan["error"])
+        pfd = dev.search_plan(f_out, objective="pfd")
+        self.assertEqual(pfd["f_pfd"], plan["f_pfd_max"])
+        self.assertGreater(abs(pfd["error"]), plan["error_min"])
+        limited = dev.search_plan(f_out, objective="pfd", max_error=1.)
+        self.assertLessEqual(abs(limited["error"]), 1.)
+        self.assertLess(limited["candidates"], plan["candidates"])
+        self.assertEqual(dev.apply_plan(plan), plan["frequency"])
+        self.assertEqual(dev.ref_div_factor, plan["r_cnt"])
+        applied = dev.get_frequency_plan()
+        for k in ("r_cnt", "f_pfd", "n_int", "n_fract", "n_mod",
+                  "band_sel_div", "frequency"):
+            self.assertEqual(applied[k], plan[k], k)
+        self.assertEqual(dev.get_plan_cache_stats()["size"], 0)
+        with self.assertRaises(ValueError):
+            dev.search_plan(f_out, objective="noise")
+        with self.assertRaises(ValueError):
+            dev.search_plan(5e9)
+
+    def test_decode_registers_round_trip(self):
+        f_out = self.frequencies()
+        for config in self.configs:
+            with self.subTest(**config):
+                dev = self.make(**config)
+                regs, f, _ = dev.plan_frequencies(f_out)
+                d = dev.decode_registers(regs)
+                self.assertTrue(np.all(d["valid"]))
+                np.testing.assert_allclose(d["frequency"], f, rtol=1e-12)
+                for i, fi in enumerate(f_out):
+                    dev.set_frequency(float(fi))
+                    plan = dev.get_frequency_plan()
+                    for k in ("r_cnt", "rf_div_sel", "prescaler_en",
+                              "n_int", "n_fract", "n_mod", "band_sel_div",
+                              "ref_doubler_en", "ref_div2_en"):
+                        self.assertEqual(d[k][i], plan[k], k)
+                    self.assertAlmostEqual(d["f_pfd"][i], plan["f_pfd"])
+                # the charge pump current is quantized to 312 uA steps
+                self.assertTrue(np.all(
+                    dev.reg2_charge_pump_curr_ua(d["charge_pump_curr"]) ==
+                    dev.reg2_charge_pump_curr_ua(dev.charge_pump_curr)))
+                for k in ("clk_divider_12bit", "output_power",
+                          "muxout_select", "cycle_slip_reduction_en"):
+                    self.assertTrue(np.all(d[k] == getattr(dev, k)), k)
+
+    def test_decode_registers_single(self):
+        dev = self.make(**self.configs[0])
+        f = dev.set_frequency(2.05e9)
+        # get_registers() order, reg5 down to reg0
+        d = dev.decode_registers(list(reversed(dev._regs)))
+        self.assertEqual(d, dev.decode_registers(dev._regs))
+        self.assertIsInstance(d["n_int"], int)
+        self.assertTrue(d["valid"])
+        self.assertAlmostEqual(d["frequency"], f)
+
+    def test_decode_registers_invalid(self):
+        dev = self.make(**self.configs[0])
+        with self.assertRaises(ValueError):
+            dev.decode_registers([0]*6)
+        with self.assertRaises(ValueError):
+            dev.decode_registers(list(range(5)))
+        with self.assertRaises(ValueError):
+            ADF4350().decode_registers(list(range(6)))
+
+    def test_decode_applied_plan(self):
+        dev = self.make(**self.configs[0])
+        plan = dev.search_plan(2.05e9 + 1234.5)
+        dev.apply_plan(plan)
+        d = dev.decode_registers(dev._regs)
+        self.assertTrue(d["valid"])
+        self.assertAlmostEqual(d["frequency"], plan["frequency"], delta=1e-3)
+        for k in ("r_cnt", "n_int", "n_fract", "n_mod"):
+            self.assertEqual(d[k], plan[k])
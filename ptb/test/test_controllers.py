@@ -0,0 +1,73 @@
+import asyncio
+import importlib
+import socket
+import unittest
+
+try:
+    from sipyco.pc_rpc import AsyncioClient
+except ImportError:
+    AsyncioClient = None
+
+from ptb import sim
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipIf(AsyncioClient is None, "sipyco not installed")
+class ControllerCase(unittest.TestCase):
+    """Run each controller against an emulator and call it over RPC."""
+    timeout = 10.
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    async def smoke(self, kind, device, target, expected):
+        module = importlib.import_module("ptb.aqctl_ptb_" + kind)
+        emulator = sim.emulators["temp" if kind == "rack" else kind]()
+        server = await emulator.start()
+        url = "tcp://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+        port = free_port()
+        args = module.get_argparser().parse_args([
+            "-d", device + url, "--no-localhost-bind", "--bind", "127.0.0.1",
+            "-p", str(port), "--metrics"])
+        task = asyncio.ensure_future(module.run(args))
+        client = AsyncioClient()
+        try:
+            while True:  # until the controller listens
+                try:
+                    await client.connect_rpc("127.0.0.1", port, target)
+                except OSError:
+                    if task.done():
+                        task.result()
+                    await asyncio.sleep(.01)
+                else:
+                    break
+            self.assertEqual(await client.ping(), expected)
+            await client.terminate()
+            await task
+        finally:
+            client.close_rpc()
+            task.cancel()
+            server.close()
+            await server.wait_closed()
+
+    def test_controllers(self):
+        for kind, device, target, expected in (
+                ("synth", "", "ptb_synth", True),
+                ("voltage", "", "ptb_voltage", True),
+                ("temp", "", "ptb_temp", True),
+                ("shutter", "", "ptb_shutter", True),
+                ("rack", "temp0=temp:", "ptb_rack", {"temp0": True})):
+            with self.subTest(kind):
+                self.loop.run_until_complete(asyncio.wait_for(
+                    self.smoke(kind, device, target, expected),
+                    self.timeout))
@@ -0,0 +1,90 @@
+from ptb.synth_tcp import SynthTCP
+from ptb.voltage_tcp import VoltageTCP
+from ptb.temp_tcp import TempTCP
+from ptb.shutter_tcp import ShutterTCP
+from ptb.test.emulator import EmulatorCase
+
+
+class SynthCase(EmulatorCase):
+    kind = "synth"
+    driver = SynthTCP
+
+    def setUp(self):
+        super().setUp()
+        self.dev.set(ref_frequency=100e6, ref_div_factor=4)
+
+    def test_version(self):
+        self.assertEqual(self.run_async(self.dev.version()), "ptb 1.0")
+        self.assertTrue(self.run_async(self.dev.ping()))
+
+    def test_start(self):
+        self.emulator.lock_time = 0.
+        self.dev.set_frequency(2.05e9)
+        self.run_async(self.dev.start())
+        regs = list(reversed(self.dev._regs))
+        self.assertEqual(self.emulator.regs, regs)
+        self.run_async(self.dev.save())
+        self.assertEqual(self.emulator.eeprom, regs)
+        self.assertTrue(self.run_async(self.dev.locked()))
+
+
+class VoltageCase(EmulatorCase):
+    kind = "voltage"
+    driver = VoltageTCP
+
+    def test_version(self):
+        self.assertEqual(self.run_async(self.dev.version()),
+                         "get version ptb-voltage 1.0")
+        self.assertEqual(self.run_async(self.dev.get_temperature()),
+                         [2048, 2048])
+
+    def test_set_voltage(self):
+        values, channels = self.run_async(
+            self.dev.set_voltage([1., -2.], [3, 5]))
+        self.assertEqual(values, [1., -2.])
+        self.assertEqual(channels, [3, 5])
+        gain = self.emulator.default_gain
+        self.assertEqual(self.emulator.data[2], round(0x8000 + gain))
+        self.assertEqual(self.emulator.data[4], round(0x8000 - 2*gain))
+        self.assertEqual(self.emulator.active[2], 0x8000)
+        self.run_async(self.dev.ldac())
+        self.assertEqual(self.emulator.active, self.emulator.data)
+        data, channels = self.run_async(self.dev.get_data([3, 5]))
+        self.assertEqual(data, self.emulator.data[2:5:2])
+        self.assertEqual(channels, [3, 5])
+
+    def test_gain_offset(self):
+        self.run_async(self.dev.set_gain([1000.], [2]))
+        self.run_async(self.dev.set_offset([-7], [2]))
+        self.run_async(self.dev.set_voltage([1.], [2]))
+        self.assertEqual(self.emulator.data[1], 0x8000 - 7 + 1000)
+        self.run_async(self.dev.factory())
+        self.assertEqual(self.emulator.gain[1], self.emulator.default_gain)
+
+
+class TempCase(EmulatorCase):
+    kind = "temp"
+    driver = TempTCP
+
+    def test_get(self):
+        self.assertEqual(self.run_async(self.dev.version()), "ptb-temp 1.0")
+        t = self.run_async(self.dev.get_all())
+        self.assertEqual(len(t), 8)
+        for ti in t + [self.run_async(self.dev.get(3))]:
+            self.assertAlmostEqual(ti, 21., delta=.02)
+
+
+class ShutterCase(EmulatorCase):
+    kind = "shutter"
+    driver = ShutterTCP
+
+    def test_status(self):
+        self.assertEqual(self.run_async(self.dev.version()),
+                         b"ptb-shutter 1.0")
+        self.assertEqual(self.run_async(self.dev.status()), (False,)*3)
+        self.emulator.errors[1] = True
+        self.assertEqual(self.run_async(self.dev.status()),
+                         (False, True, False))
+        self.assertEqual(self.run_async(self.dev.clear()), (False,)*3)
+        self.assertEqual(self.run_async(self.dev.passthrough(2, ord("W"))),
+                         b"2W")
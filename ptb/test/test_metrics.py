@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import unittest
+
+from ptb import sim
+from ptb.metrics import (Metrics, format_prometheus, serve_prometheus,
+                         add_metrics_args, start_metrics)
+from ptb.temp_tcp import TempTCP
+from ptb.test.emulator import EmulatorCase
+
+
+class MetricsCase(unittest.TestCase):
+    def make(self):
+        m = Metrics()
+        m.latency_bins = (1e-3, 1e-2)
+        m.record_command("get", 8)
+        m.record_reply("get", 20, 5e-3)
+        m.record_command("get", 8)
+        m.record_error("get", asyncio.TimeoutError())
+        m.record_command("set", 10)
+        m.record_error("set", ConnectionError())
+        return m
+
+    def test_counters(self):
+        m = self.make()
+        stats = m.get_stats()
+        self.assertEqual(stats["bins"], [1e-3, 1e-2])
+        self.assertEqual(stats["commands"]["get"], {
+            "count": 2, "bytes_out": 16, "bytes_in": 20, "errors": 0,
+            "timeouts": 1, "latency_sum": 5e-3, "latency_counts": [0, 1, 0]})
+        self.assertEqual(stats["commands"]["set"]["errors"], 1)
+        # a snapshot
+        stats["commands"]["get"]["latency_counts"][0] = 7
+        m.record_reply("get", 1, 1.)
+        self.assertEqual(m.get_stats()["commands"]["get"]["latency_counts"],
+                         [0, 1, 1])
+        m.clear()
+        self.assertEqual(m.get_stats()["commands"], {})
+
+    def test_command_name(self):
+        m = Metrics()
+        self.assertEqual(m.name(b"set volt 1 1 2.0\n"), "set")
+        self.assertEqual(m.name(b"\n"), "")
+
+    def test_format_prometheus(self):
+        m = self.make()
+        del m._stats["set"]
+        self.assertEqual(m.prometheus(labels={"target": 'a"b'}), """\
+# HELP ptb_commands_total Commands sent
+# TYPE ptb_commands_total counter
+ptb_commands_total{target="a\\"b",command="get"} 2
+# HELP ptb_bytes_sent_total Bytes sent
+# TYPE ptb_bytes_sent_total counter
+ptb_bytes_sent_total{target="a\\"b",command="get"} 16
+# HELP ptb_bytes_received_total Bytes received
+# TYPE ptb_bytes_received_total counter
+ptb_bytes_received_total{target="a\\"b",command="get"} 20
+# HELP ptb_errors_total Failed commands
+# TYPE ptb_errors_total counter
+ptb_errors_total{target="a\\"b",command="get"} 0
+# HELP ptb_timeouts_total Timed out commands
+# TYPE ptb_timeouts_total counter
+ptb_timeouts_total{target="a\\"b",command="get"} 1
+# HELP ptb_latency_seconds Reply latency
+# TYPE ptb_latency_seconds histogram
+ptb_latency_seconds_bucket{target="a\\"b",command="get",le="0.001"} 0
+ptb_latency_seconds_bucket{target="a\\"b",command="get",le="0.01"} 1
+ptb_latency_seconds_bucket{target="a\\"b",command="get",le="+Inf"} 1
+ptb_latency_seconds_sum{target="a\\"b",command="get"} 0.005
+ptb_latency_seconds_count{target="a\\"b",command="get"} 1
+""")
+        self.assertEqual(format_prometheus(None), "")
+
+
+class StatsCase(EmulatorCase):
+    kind = "temp"
+    driver = TempTCP
+
+    def test_get_stats(self):
+        self.assertIsNone(self.dev.get_stats())
+        self.dev.enable_metrics()
+        self.run_async(self.dev.get(1))
+        self.run_async(self.dev.get_all())
+        self.dev.timeout = .1
+        self.emulator.drop_rate = 1.
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(self.dev.get(2))
+        commands = self.dev.get_stats()["commands"]
+        self.assertEqual(sorted(commands), ["1", "2", "a"])
+        self.assertEqual(commands["1"]["count"], 1)
+        self.assertEqual(commands["1"]["bytes_out"], len("1\r"))
+        self.assertEqual(commands["1"]["bytes_in"], len("1:21.000\r\n"))
+        self.assertEqual(sum(commands["a"]["latency_counts"]), 1)
+        self.assertEqual(commands["2"]["timeouts"], 1)
+        self.assertEqual(sum(commands["2"]["latency_counts"]), 0)
+        self.dev.enable_metrics(False)
+        self.assertIsNone(self.dev.get_stats())
+
+    async def fetch(self, port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+        ret = await reader.read()
+        writer.close()
+        return ret
+
+    def test_serve_prometheus(self):
+        server = self.run_async(serve_prometheus(
+            lambda: "ptb_up 1\n", "127.0.0.1", 0))
+        try:
+            ret = self.run_async(self.fetch(
+                server.sockets[0].getsockname()[1]))
+        finally:
+            server.close()
+        head, body = ret.split(b"\r\n\r\n")
+        head = head.split(b"\r\n")
+        self.assertEqual(head[0], b"HTTP/1.0 200 OK")
+        self.assertIn(b"Content-Type: text/plain; version=0.0.4", head)
+        self.assertIn(b"Content-Length: 9", head)
+        self.assertEqual(body, b"ptb_up 1\n")
+
+    def test_start_metrics(self):
+        parser = argparse.ArgumentParser()
+        add_metrics_args(parser)
+        devices = {"temp0": self.dev}
+        self.assertIsNone(self.run_async(start_metrics(
+            devices, parser.parse_args([]), "127.0.0.1")))
+        self.assertIsNone(self.dev.get_stats())
+        self.assertIsNone(self.run_async(start_metrics(
+            devices, parser.parse_args(["--metrics"]), "127.0.0.1")))
+        self.assertEqual(self.dev.get_stats()["commands"], {})
+
+        emulator = sim.emulators["temp"]()
+        emulator_server = self.run_async(emulator.start())
+        devices["temp1"] = self.run_async(self.driver.connect(
+            "127.0.0.1", emulator_server.sockets[0].getsockname()[1]))
+        server = self.run_async(start_metrics(
+            devices, parser.parse_args(["--metrics-port", "0"]),
+            "127.0.0.1"))
+        try:
+            for dev in devices.values():
+                self.run_async(dev.version())
+            ret = self.run_async(self.fetch(
+                server.sockets[0].getsockname()[1]))
+        finally:
+            server.close()
+            devices["temp1"].close()
+            emulator_server.close()
+        lines = ret.decode().split("\r\n\r\n")[1].splitlines()
+        self.assertEqual(lines.count("# TYPE ptb_commands_total counter"), 1)
+        self.assertIn('ptb_commands_total{target="temp0",command="v"} 1',
+                      lines)
+        self.assertIn('ptb_commands_total{target="temp1",command="v"} 1',
+                      lines)
@@ -0,0 +1,106 @@
+import socket
+from unittest import mock
+
+from ptb import sim
+from ptb.rack import Rack, parse_device
+from ptb.transport import StreamDevice
+from ptb.test.emulator import EmulatorCase
+
+
+class RackCase(EmulatorCase):
+    """Rack of emulated devices, the first of which is `self.emulator`."""
+    kind = "synth"
+    devices = [("synth0", "synth"), ("synth1", "synth"),
+               ("voltage0", "voltage"), ("temp0", "temp"),
+               ("shutter0", "shutter")]
+
+    async def connect(self):
+        self.emulators = {self.devices[0][0]: self.emulator}
+        for name, kind in self.devices[1:]:
+            self.emulators[name] = sim.emulators[kind](seed=0)
+        self.servers = []
+        self.specs = []
+        for name, kind in self.devices:
+            server = await self.emulators[name].start()
+            self.servers.append(server)
+            port = server.sockets[0].getsockname()[1]
+            self.specs.append((name, kind, "127.0.0.1", port))
+        return await Rack.connect(self.specs)
+
+    def tearDown(self):
+        self.dev.close()
+        for server in self.servers:
+            server.close()
+            self.run_async(server.wait_closed())
+        super().tearDown()
+
+    def test_parse_device(self):
+        self.assertEqual(parse_device("a=synth:host"),
+                         ("a", "synth", "host", 80))
+        self.assertEqual(parse_device("a=temp:host:3000"),
+                         ("a", "temp", "host", 3000))
+        self.assertEqual(parse_device("a=temp:serial:///dev/ttyUSB0"),
+                         ("a", "temp", "serial:///dev/ttyUSB0", 80))
+        for spec in ("synth:host", "a=foo:host", "a=synth:"):
+            with self.assertRaises(ValueError):
+                parse_device(spec)
+
+    def test_connect(self):
+        self.assertEqual(self.dev.get_devices(),
+                         [name for name, _ in self.devices])
+        self.assertEqual(self.dev.get_devices("synth"), ["synth0", "synth1"])
+        self.assertEqual(self.run_async(self.dev.ping()),
+                         {name: True for name, _ in self.devices})
+        with self.assertRaises(ValueError):
+            self.run_async(Rack.connect(self.specs[:1]*2))
+
+    def test_call(self):
+        for name in ("synth0", "synth1"):
+            self.emulators[name].latency = .2
+        t0 = self.loop.time()
+        self.assertEqual(
+            self.run_async(self.dev.call("version", kind="synth")),
+            {"synth0": "ptb 1.0", "synth1": "ptb 1.0"})
+        # concurrently
+        self.assertLess(self.loop.time() - t0, .35)
+        self.assertEqual(
+            self.run_async(self.dev.call("get", "timeout", names=["synth1"])),
+            {"synth1": self.dev.devices["synth1"].timeout})
+        self.assertEqual(
+            self.run_async(self.dev.status()), {"shutter0": (False,)*3})
+        self.assertEqual(
+            len(self.run_async(self.dev.get_temperatures())["temp0"]), 8)
+        for method in ("_write", "close", "connect_url"):
+            with self.assertRaises(ValueError):
+                self.run_async(self.dev.call(method))
+
+    def test_set_frequency(self):
+        for name in ("synth0", "synth1"):
+            self.emulators[name].lock_time = 0.
+        self.run_async(self.dev.call("set", kind="synth",
+                                     ref_frequency=100e6, ref_div_factor=4))
+        f = self.run_async(self.dev.set_frequency(2.05e9))
+        self.assertEqual(sorted(f), ["synth0", "synth1"])
+        for name in f:
+            self.assertAlmostEqual(f[name], 2.05e9, delta=1e6)
+            self.assertEqual(self.emulators[name].regs,
+                             self.dev.devices[name].get_registers())
+        f = self.run_async(self.dev.set_frequency({"synth1": 2.1e9}))
+        self.assertEqual(list(f), ["synth1"])
+        self.assertNotEqual(self.emulators["synth0"].regs,
+                            self.emulators["synth1"].regs)
+        self.assertEqual(self.run_async(self.dev.locked()),
+                         {"synth0": True, "synth1": True})
+
+    def test_connect_failure(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()  # nothing listens on the port
+        with mock.patch.object(StreamDevice, "close", autospec=True,
+                               side_effect=StreamDevice.close) as close:
+            with self.assertRaises(OSError):
+                self.run_async(Rack.connect(
+                    self.specs + [("dead", "temp", "127.0.0.1", port)]))
+        # the devices connected meanwhile have been closed
+        self.assertEqual(close.call_count, len(self.specs))
@@ -0,0 +1,28 @@
+from ptb.shutter_tcp import ShutterTCP
+from ptb.test.emulator import EmulatorCase
+
+
+class ShutterCase(EmulatorCase):
+    kind = "shutter"
+    driver = ShutterTCP
+
+    def test_monitor(self):
+        changes = []
+        self.dev.start_monitor(.01, auto_clear=True, notify=changes.append)
+        self.emulator.errors[0] = True
+        self.wait_for(lambda: len(changes) >= 2)
+        self.dev.stop_monitor()
+        self.assertEqual(changes[:2], [(True, False, False), (False,)*3])
+        self.assertEqual(self.dev.get_last_status(), (False,)*3)
+
+    def test_monitor_changes(self):
+        changes = []
+        self.assertIsNone(self.dev.get_last_status())
+        self.dev.start_monitor(.01, notify=changes.append)
+        self.wait_for(lambda: self.emulator.counts.get("e", 0) >= 3)
+        self.assertEqual(changes, [(False,)*3])
+        self.emulator.errors[2] = True
+        self.wait_for(lambda: len(changes) >= 2)
+        self.dev.stop_monitor()
+        self.assertEqual(changes, [(False,)*3, (False, False, True)])
+        self.assertEqual(self.emulator.errors, [False, False, True])
@@ -0,0 +1,82 @@
+import numpy as np
+
+from ptb.synth_tcp import SynthTCP
+from ptb.test.emulator import EmulatorCase
+
+
+class SynthCase(EmulatorCase):
+    kind = "synth"
+    driver = SynthTCP
+
+    def setUp(self):
+        super().setUp()
+        self.dev.set(ref_frequency=100e6, ref_div_factor=4)
+
+    def test_start_delta(self):
+        self.assertIsNone(self.dev.get_registers())
+        self.dev.set_frequency(2.05e9)
+        self.assertTrue(self.run_async(self.dev.start(delta=True)))
+        regs = list(reversed(self.dev._regs))
+        self.assertEqual(self.dev.get_registers(), regs)
+        self.assertFalse(self.run_async(self.dev.start(delta=True)))
+        self.assertEqual(self.emulator.counts["start"], 1)
+        self.assertTrue(self.run_async(self.dev.start()))
+        self.assertEqual(self.emulator.counts["start"], 2)
+        self.dev.set_frequency(2.1e9)
+        self.assertTrue(self.run_async(self.dev.start(delta=True)))
+        self.assertEqual(self.emulator.regs, self.dev.get_registers())
+
+
+    def test_start_and_wait_locked(self):
+        self.emulator.lock_time = .02
+        self.dev.set_frequency(2.05e9)
+        t = self.run_async(self.dev.start_and_wait_locked())
+        self.assertGreater(t, 0)
+        self.assertTrue(self.run_async(self.dev.locked()))
+        self.run_async(self.dev.start_and_wait_locked(
+            self.dev.get_registers()))
+        hist = self.dev.get_lock_histogram()
+        self.assertEqual(len(hist["bins"]) + 1, len(hist["bands"][None]))
+        self.assertEqual(sum(hist["bands"][2000000000]), 1)
+        self.assertEqual(sum(hist["bands"][None]), 1)
+
+    def test_no_frequency(self):
+        for method in (self.dev.start, self.dev.save,
+                       self.dev.start_and_wait_locked):
+            with self.assertRaises(ValueError):
+                self.run_async(method())
+        self.assertEqual(self.emulator.counts, {})
+
+    def test_hop(self):
+        f = np.linspace(2e9, 2.1e9, 5)
+        f_actual = self.dev.build_hop_table("t", f)
+        regs, f_plan, _ = self.dev.plan_frequencies(f)
+        self.assertEqual(f_actual, f_plan.tolist())
+        self.run_async(self.dev.play_hops("t", [4, 1]))
+        self.assertEqual(self.emulator.regs, regs[1, ::-1].tolist())
+        self.assertEqual(self.dev.get_registers(), regs[1, ::-1].tolist())
+        self.assertEqual(self.emulator.counts["start"], 2)
+        self.run_async(self.dev.hop("t", 3))
+        self.assertEqual(self.emulator.regs, regs[3, ::-1].tolist())
+        # same registers as set_frequency() and start()
+        self.dev.set_frequency(f[3])
+        self.assertFalse(self.run_async(self.dev.start(delta=True)))
+        self.dev.delete_hop_table("t")
+        with self.assertRaises(KeyError):
+            self.run_async(self.dev.hop("t", 0))
+        with self.assertRaises(ValueError):
+            self.dev.build_hop_table("u", [1e9, 5e9])
+
+    def test_reconnect_restores_registers(self):
+        self.dev.set_frequency(2.05e9)
+        self.run_async(self.dev.start())
+        regs = self.emulator.regs
+        # power cycle the device
+        self.emulator.disconnect_rate = 1.
+        with self.assertRaises(ConnectionError):
+            self.run_async(self.dev.locked())
+        self.emulator.disconnect_rate = 0.
+        self.emulator.regs = None
+        self.wait_for(lambda: self.emulator.regs == regs)
+        self.assertEqual(self.dev.get_link_stats()["reconnects"], 1)
+        self.assertTrue(self.run_async(self.dev.locked()))
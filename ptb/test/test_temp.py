@@ -0,0 +1,33 @@
+import numpy as np
+
+from ptb.temp_tcp import TempTCP
+from ptb.test.emulator import EmulatorCase
+
+
+class TempCase(EmulatorCase):
+    kind = "temp"
+    driver = TempTCP
+
+    def test_sampling(self):
+        self.assertIsNone(self.dev.get_latest())
+        self.assertIsNone(self.dev.get_aggregates())
+        self.dev.start_sampling(.01)
+        self.wait_for(lambda: len(self.dev.get_history()[0]) >= 3)
+        self.dev.stop_sampling()
+        times, samples = self.dev.get_history()
+        self.assertEqual(samples.shape, (len(times), 8))
+        self.assertEqual(self.dev.get_latest()[1], samples[-1].tolist())
+        aggregates = self.dev.get_aggregates()
+        self.assertEqual(aggregates["n"], len(times))
+        np.testing.assert_allclose(aggregates["mean"], samples.mean(axis=0))
+        self.assertEqual(len(self.dev.get_history(duration=0.)[0]), 0)
+
+    def test_history_wraps(self):
+        self.dev.history_length = 3
+        self.dev.start_sampling(.01)
+        self.wait_for(lambda: self.dev._count >= 5)
+        self.dev.stop_sampling()
+        times, samples = self.dev.get_history()
+        self.assertEqual(samples.shape, (3, 8))
+        self.assertTrue(np.all(np.diff(times) > 0))
+        self.assertEqual(self.dev.get_latest()[0], times[-1])
@@ -0,0 +1,189 @@
+import asyncio
+import socket
+from unittest import mock
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+from ptb.temp_tcp import TempTCP
+from ptb.test.emulator import EmulatorCase
+
+
+class ResyncCase(EmulatorCase):
+    kind = "temp"
+    driver = TempTCP
+
+    def test_late_reply(self):
+        self.dev.timeout = .2
+        # late by less than the drain time
+        self.emulator.latencies["v"] = .25
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(self.dev.version())
+        self.emulator.latencies.clear()
+        # the late reply must not be taken for the reply to this command
+        self.assertAlmostEqual(self.run_async(self.dev.get(3)), 21.,
+                               delta=.02)
+        self.assertEqual(self.emulator.counts["3"], 1)
+
+    def test_late_pipelined_replies(self):
+        self.dev.timeout = .5
+        # late by more than the drain time
+        self.emulator.latencies.update({"1": .8, "2": .3})
+        ret = self.run_async(asyncio.gather(
+            self.dev.get(1), self.dev.get(2), return_exceptions=True))
+        for r in ret:
+            self.assertIsInstance(r, asyncio.TimeoutError)
+        self.emulator.latencies.clear()
+        self.assertAlmostEqual(self.run_async(self.dev.get(3)), 21.,
+                               delta=.02)
+        self.assertEqual(self.run_async(self.dev.version()), "ptb-temp 1.0")
+
+    def test_lost_reply(self):
+        self.dev.timeout = .2
+        self.emulator.drop_rate = 1.
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(self.dev.get(1))
+        self.emulator.drop_rate = 0.
+        self.assertEqual(self.run_async(self.dev.version()), "ptb-temp 1.0")
+
+    def test_zero_timeout(self):
+        self.emulator.latencies["v"] = .3
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(self.dev.ask("v", timeout=0))
+
+
+class WriteCase(EmulatorCase):
+    kind = "temp"
+    driver = TempTCP
+
+    def count_writes(self, dev):
+        writer = dev._transport._writer
+        return mock.patch.object(writer, "write", wraps=writer.write)
+
+    def test_nodelay(self):
+        writer = self.dev._transport._writer
+        sock = writer.get_extra_info("socket")
+        self.assertTrue(sock.getsockopt(socket.IPPROTO_TCP,
+                                        socket.TCP_NODELAY))
+        self.assertEqual(writer.transport.get_write_buffer_limits(),
+                         (self.dev._transport.write_low_water,
+                          self.dev._transport.write_high_water))
+
+    def gather_get(self, dev):
+        t = self.run_async(asyncio.gather(*[dev.get(i) for i in range(8)]))
+        self.assertEqual(len(t), 8)
+
+    def test_coalesce(self):
+        with self.count_writes(self.dev) as write:
+            self.gather_get(self.dev)
+        self.assertEqual(write.call_count, 8)
+        port = self.server.sockets[0].getsockname()[1]
+        with self.run_async(self.driver.connect(
+                "127.0.0.1", port, coalesce=True)) as dev:
+            with self.count_writes(dev) as write:
+                self.gather_get(dev)
+            self.assertEqual(write.call_count, 1)
+            self.assertEqual(write.call_args[0][0],
+                             b"".join(b"%d\r" % i for i in range(8)))
+
+    def test_batch(self):
+        async def burst():
+            async with self.dev.batch():
+                a = asyncio.ensure_future(self.dev.get(1))
+                async with self.dev.batch():
+                    b = asyncio.ensure_future(self.dev.version())
+                # nothing is written until the outermost batch ends
+                await asyncio.sleep(.01)
+                self.assertEqual(self.emulator.counts, {})
+            return await a, await b
+
+        with self.count_writes(self.dev) as write:
+            t, version = self.run_async(burst())
+        self.assertEqual(write.call_count, 1)
+        self.assertAlmostEqual(t, 21., delta=.02)
+        self.assertEqual(version, "ptb-temp 1.0")
+
+    def test_drain(self):
+        # a device that does not read until told to
+        a, b = socket.socketpair()
+        b.setblocking(False)
+        a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 12)
+        reader, writer = self.run_async(asyncio.open_connection(sock=a))
+        dev = self.driver(reader, writer)
+        try:
+            transport = dev._transport
+            for i in range(1 << 10):
+                dev.do("x"*63)
+            # the burst is buffered regardless of the limit
+            self.assertGreater(writer.transport.get_write_buffer_size(),
+                               transport.write_high_water)
+            drain = asyncio.ensure_future(dev.drain())
+            self.sleep(.05)
+            self.assertFalse(drain.done())
+
+            async def read():
+                while not drain.done():
+                    await self.loop.sock_recv(b, 1 << 12)
+            self.run_async(read())
+            self.assertLessEqual(writer.transport.get_write_buffer_size(),
+                                 transport.write_low_water)
+        finally:
+            dev.close()
+            b.close()
+
+
+class URLCase(EmulatorCase):
+    kind = "temp"
+    driver = TempTCP
+
+    def connect_url(self, url):
+        port = self.server.sockets[0].getsockname()[1]
+        return self.run_async(self.driver.connect_url(url, port))
+
+    def test_tcp(self):
+        port = self.server.sockets[0].getsockname()[1]
+        for url, coalesce in (
+                ("127.0.0.1", False),
+                ("tcp://127.0.0.1", False),
+                ("tcp://127.0.0.1:{}".format(port), False),
+                ("tcp://127.0.0.1?coalesce=1", True),
+                ("tcp://127.0.0.1?coalesce=True", True),
+                ("tcp://127.0.0.1?coalesce=no", False)):
+            with self.subTest(url):
+                with self.connect_url(url) as dev:
+                    self.assertEqual(dev._transport._coalesce, coalesce)
+                    self.assertEqual(self.run_async(dev.version()),
+                                     "ptb-temp 1.0")
+
+    def test_invalid(self):
+        for url in ("ftp://127.0.0.1", "tcp://", "tcp://127.0.0.1?foo=1",
+                    "tcp://127.0.0.1?coalesce=maybe", "serial://",
+                    "serial:///dev/null?parity=E"):
+            with self.subTest(url):
+                with self.assertRaises(ValueError):
+                    self.connect_url(url)
+
+
+class SerialCase(EmulatorCase):
+    kind = "temp"
+    driver = TempTCP
+
+    async def connect(self):
+        if serial_asyncio is None:
+            self.skipTest("pyserial-asyncio not installed")
+        try:
+            path = await self.emulator.start_pty()
+        except OSError:
+            self.skipTest("pseudo terminals not available")
+        return await self.driver.connect_url(
+            "serial://{}?baudrate=9600&coalesce=1".format(path))
+
+    def test_get(self):
+        self.assertTrue(self.dev._transport._coalesce)
+        self.assertEqual(self.run_async(self.dev.version()), "ptb-temp 1.0")
+        t = self.run_async(asyncio.gather(
+            *[self.dev.get(i) for i in range(8)]))
+        for ti in t:
+            self.assertAlmostEqual(ti, 21., delta=.02)
@@ -0,0 +1,201 @@
+import asyncio
+import gc
+
+import numpy as np
+
+from ptb.voltage_tcp import VoltageTCP
+from ptb.test.emulator import EmulatorCase
+
+
+class VoltageCase(EmulatorCase):
+    kind = "voltage"
+    driver = VoltageTCP
+
+    def test_set_voltage_cached(self):
+        self.run_async(self.dev.set_voltage([1., 2.]))
+        self.run_async(self.dev.set_voltage([1., 3.]))
+        self.assertEqual(self.emulator.counts["set volt"], 2)
+        self.run_async(self.dev.set_voltage([1., 3.]))
+        self.assertEqual(self.emulator.counts["set volt"], 2)
+        self.run_async(self.dev.set_voltage([1., 3.], force=True))
+        self.assertEqual(self.emulator.counts["set volt"], 3)
+        # a new gain changes the DAC value of the same voltage
+        self.run_async(self.dev.set_gain([1000.], [2]))
+        self.run_async(self.dev.set_voltage([1., 3.]))
+        self.assertEqual(self.emulator.counts["set volt"], 4)
+        self.assertEqual(self.emulator.data[1], 0x8000 + 3000)
+
+    def test_timeout_resync(self):
+        self.dev.timeout = .2
+        self.run_async(self.dev.set_voltage([1.]))
+        self.emulator.drop_rate = 1.
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(self.dev.set_voltage([2.]))
+        self.emulator.drop_rate = 0.
+        # the device applied the write but the reply was lost
+        self.run_async(self.dev.set_voltage([1.]))
+        self.assertEqual(self.emulator.counts["set volt"], 3)
+        self.assertEqual(self.emulator.data[0],
+                         round(0x8000 + self.emulator.default_gain))
+
+    def test_bulk(self):
+        values = np.linspace(-1, 1, 8)
+        self.run_async(self.dev.set_voltage(values.tolist()))
+        data = self.emulator.data
+        self.run_async(self.dev.set_data_bulk([0]*8))
+        self.assertEqual(self.emulator.data, [0]*8)
+        ret, channels = self.run_async(self.dev.set_voltage_bulk(values))
+        self.assertEqual(self.emulator.data, data)
+        np.testing.assert_allclose(ret, values, atol=1e-4)
+        np.testing.assert_array_equal(channels, np.arange(1, 9))
+        ret, channels = self.run_async(
+            self.dev.set_data_bulk(np.array([1, 2]), [8, 3]))
+        self.assertEqual(ret.tolist(), [1, 2])
+        self.assertEqual(channels.tolist(), [8, 3])
+        self.assertEqual(self.emulator.data[7], 1)
+        self.assertEqual(self.emulator.data[2], 2)
+        self.assertIsNone(self.run_async(
+            self.dev.set_voltage_bulk(values, verify=False)))
+
+    def test_stream_voltage(self):
+        times = np.linspace(0, .02, 5)
+        values = np.linspace(-1, 1, 10).reshape(5, 2)
+        stats = self.run_async(self.dev.stream_voltage(
+            times, values, max_in_flight=2))
+        self.assertEqual(stats["steps"], 5)
+        self.assertGreaterEqual(stats["duration"], .02)
+        self.assertEqual(self.emulator.counts["set ldac"], 5)
+        self.assertEqual(self.emulator.counts["set volt"], 5)
+        self.assertEqual(self.emulator.active, self.emulator.data)
+        self.assertEqual(
+            self.emulator.data[0],
+            round(0x8000 + values[-1, 0]*self.emulator.default_gain))
+
+    def test_stream_voltage_failure(self):
+        errors = []
+        self.loop.set_exception_handler(lambda loop, ctx: errors.append(ctx))
+        times = np.linspace(0, .02, 5)
+        values = np.zeros((5, 2))
+        self.emulator.disconnect_rate = 1.
+        with self.assertRaises(ConnectionError):
+            self.run_async(self.dev.stream_voltage(times, values))
+        # all steps were awaited or cancelled
+        gc.collect()
+        self.assertEqual(errors, [])
+
+    def test_calibration(self):
+        self.emulator.gain[1] = 1000.
+        self.emulator.offset[1] = -7
+        with self.assertRaises(ValueError):
+            self.dev.voltage_to_data([1., 1.])
+        self.run_async(self.dev.sync_calibration())
+        data = self.dev.voltage_to_data([1., 1.])
+        self.run_async(self.dev.set_voltage([1., 1.]))
+        self.assertEqual(data.tolist(), self.emulator.data[:2])
+        np.testing.assert_allclose(self.dev.data_to_voltage(data), [1., 1.],
+                                   atol=1e-3)
+        self.run_async(self.dev.factory())
+        with self.assertRaises(ValueError):
+            self.dev.voltage_to_data([1.])
+
+    def test_set_voltage_data(self):
+        values = np.linspace(-1, 1, 8)
+        self.run_async(self.dev.set_offset([5], [3]))
+        # the calibration is read first
+        data, channels = self.run_async(self.dev.set_voltage_data(values))
+        self.assertEqual(self.emulator.counts["get gain"], 1)
+        self.assertEqual(data.tolist(), self.emulator.data)
+        self.run_async(self.dev.set_data_bulk([0]*8))
+        self.run_async(self.dev.set_voltage_bulk(values))
+        self.assertEqual(self.emulator.data, data.tolist())
+        np.testing.assert_array_equal(self.dev.predict_data(values), data)
+
+    def test_stream_voltage_raw(self):
+        times = np.linspace(0, .02, 5)
+        values = np.linspace(-1, 1, 10).reshape(5, 2)
+        self.run_async(self.dev.stream_voltage(times, values, raw=True))
+        self.assertEqual(self.emulator.counts["set data"], 5)
+        self.assertEqual(self.emulator.active[:2],
+                         self.dev.predict_data(values[-1]).tolist())
+
+    def test_reconnect_restores_setpoints(self):
+        self.run_async(self.dev.set_gain([1000.], [2]))
+        self.run_async(self.dev.set_voltage([1., 2.]))
+        self.run_async(self.dev.ldac())
+        active = list(self.emulator.active)
+        # power cycle the device
+        self.emulator.disconnect_rate = 1.
+        with self.assertRaises(ConnectionError):
+            self.run_async(self.dev.get_temperature())
+        self.emulator.disconnect_rate = 0.
+        self.emulator.__init__()
+        self.wait_for(lambda: self.emulator.active == active)
+        self.assertEqual(self.emulator.gain[1], 1000.)
+        stats = self.dev.get_link_stats()
+        self.assertEqual(stats["reconnects"], 1)
+        self.assertTrue(stats["connected"])
+
+
+class TransactionCase(EmulatorCase):
+    kind = "voltage"
+    driver = VoltageTCP
+
+    def setUp(self):
+        super().setUp()
+        self.run_async(self.dev.set_gain([1000., 2000.]))
+        self.run_async(self.dev.set_voltage([1., 1.]))
+        self.run_async(self.dev.ldac())
+        self.active = list(self.emulator.active)
+
+    def test_commit(self):
+        t = self.dev.transaction()
+        t.set_gain([3000.], [2])
+        t.set_voltage([2.], [1])
+        t.set_data([0x9000], [3])
+        t.ldac()
+        ret = self.run_async(t.commit())
+        self.assertEqual(ret["gain"], ([3000.], [2]))
+        self.assertEqual(ret["volt"], ([2.], [1]))
+        self.assertEqual(ret["data"], ([0x9000], [3]))
+        self.assertEqual(self.emulator.active[:3],
+                         [0x8000 + 2000, 0x8000 + 2000, 0x9000])
+        # one burst, committed values are cached
+        self.assertEqual(self.emulator.counts["set ldac"], 2)
+        self.run_async(self.dev.set_voltage([2.], [1]))
+        self.assertEqual(self.emulator.counts["set volt"], 2)
+
+    def test_invalid(self):
+        t = self.dev.transaction()
+        with self.assertRaises(ValueError):
+            t.set_offset([1, 2], [1])
+        self.assertEqual(self.run_async(t.commit()), {})
+
+    def test_rollback(self):
+        t = self.dev.transaction()
+        t.set_gain([3000.], [2])
+        t.set_voltage([2.], [1])
+        # rejected by the device
+        t.set_voltage([2.], [9])
+        t.ldac()
+        with self.assertLogs("ptb.voltage_protocol", "WARNING"):
+            with self.assertRaises(ValueError):
+                self.run_async(t.commit())
+        self.assertEqual(self.emulator.gain[:2], [1000., 2000.])
+        self.assertEqual(self.emulator.active, self.active)
+        self.assertEqual(self.emulator.data, self.active)
+        # the restored values are sent again
+        self.run_async(self.dev.set_voltage([2.], [1]))
+        self.assertEqual(self.emulator.data[0], 0x8000 + 2000)
+
+    def test_timeout_invalidates(self):
+        self.dev.timeout = .2
+        t = self.dev.transaction()
+        t.set_voltage([2.], [1])
+        self.emulator.drop_rate = 1.
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(t.commit())
+        self.emulator.drop_rate = 0.
+        # applied by the device although unacknowledged
+        self.assertEqual(self.emulator.data[0], 0x8000 + 2000)
+        self.run_async(self.dev.set_voltage([1.], [1]))
+        self.assertEqual(self.emulator.data[0], 0x8000 + 1000)
@@ -0,0 +1,32 @@
+import unittest
+
+from ptb.voltage_calibration import VoltageCalibration
+
+
+class VoltageCalibrationCase(unittest.TestCase):
+    def test_unknown(self):
+        c = VoltageCalibration()
+        with self.assertRaises(ValueError):
+            c.voltage_to_data([0.])
+        c.update("gain", [1000.], [2])
+        self.assertEqual(c.known([1, 2, 3]).tolist(), [False, False, False])
+        c.update("offset", [-7], [2])
+        self.assertEqual(c.known([1, 2, 3]).tolist(), [False, True, False])
+        self.assertEqual(c.voltage_to_data([1.], [2]).tolist(),
+                         [0x8000 - 7 + 1000])
+        c.reset()
+        self.assertFalse(c.known([2])[0])
+
+    def test_round_trip(self):
+        c = VoltageCalibration()
+        gain, offset = c.gain_offset([-10., 0.], [10., 100.])
+        c.update("gain", gain, [1, 2])
+        c.update("offset", offset, [1, 2])
+        u_min, u_max = c.limits([1, 2])
+        self.assertAlmostEqual(u_min[0], -10., places=3)
+        self.assertAlmostEqual(u_max[1], 100., delta=2/gain[1])
+        data = c.voltage_to_data([[0., 50.], [-20., 200.]])
+        self.assertEqual(data[1].tolist(), [0, 0xffff])
+        u = c.data_to_voltage(data[0])
+        self.assertAlmostEqual(u[0], 0., delta=1/gain[0])
+        self.assertAlmostEqual(u[1], 50., delta=1/gain[1])
@@ -0,0 +1,609 @@
+import asyncio
+import collections
+import logging
+import socket
+import urllib.parse
+
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StreamTransport:
+    """Pipelined command transport over an asyncio stream pair.
+
+    Commands are written immediately and in order. Each expected reply is
+    represented by a future that is queued when the read is requested and
+    resolved by a single reader task in FIFO order. Multiple commands can
+    be in flight on the same connection and concurrent callers can not
+    steal each other's replies.
+
+    A command and the read of its reply must be requested without
+    yielding to the event loop in between (i.e. no `await` between
+    :meth:`write` and :meth:`read`).
+
+    If a reply does not arrive within its deadline, that request and all
+    requests queued after it fail with :class:`asyncio.TimeoutError`. The
+    stream is then resynchronized: the replies still expected for the
+    failed commands that were sent are discarded as they arrive, each
+    within the deadline of its request, and any further data until the
+    stream has been quiet for :attr:`drain_time`. Commands issued during
+    resynchronization are held back and sent afterwards.
+
+    A connection closed by the device is noticed at the latest
+    :attr:`idle_time` after the last reply, even if no command is sent.
+    Data arriving while no reply is expected (e.g. a late reply to a
+    timed out request) also causes resynchronization.
+
+    If `reopen` is given, a lost connection is re-established with
+    exponential backoff between :attr:`backoff_initial` and
+    :attr:`backoff_max`. Requests that were in flight when the connection
+    was lost and requests issued while disconnected fail with
+    :class:`ConnectionError`. Once reconnected, `on_reconnect` is run to
+    restore the device state.
+
+    If :attr:`metrics` is set to a :class:`ptb.metrics.Metrics` instance,
+    commands, replies and failures are recorded there. The latency of a
+    reply is counted from when the command preceding its read was written.
+
+    With `coalesce`, commands written during one iteration of the event
+    loop are sent with a single write to the stream. This reduces the
+    number of system calls and packets for pipelined commands, in
+    particular on serial ports. Within a :class:`WriteBatch`, commands
+    are collected until the batch ends, regardless of `coalesce`.
+
+    Nagle's algorithm is disabled on TCP connections so that commands
+    are sent without delay. The stream write buffer is limited to
+    :attr:`write_high_water` bytes: once it is exceeded, :meth:`drain`
+    waits until it has been written down to :attr:`write_low_water`.
+    The limit only applies to callers awaiting :meth:`drain` (including
+    :class:`WriteBatch`). Commands are never held back by :meth:`write`,
+    so all commands of a burst of pipelined requests (e.g. concurrent
+    :meth:`ptb.protocol.LineProtocol.ask` calls) are buffered however
+    slowly the device reads them. Large bursts need to be split and
+    drained or their number of requests in flight limited by the caller
+    (see :meth:`ptb.voltage_protocol.VoltageProtocol.stream_voltage`).
+
+    Args:
+        reader (asyncio.StreamReader): Stream to read replies from.
+        writer (asyncio.StreamWriter): Stream to write commands to.
+        eol_read (bytes): Line terminator of replies.
+        reopen (callable): Coroutine function returning a new
+            `(reader, writer)` pair.
+        on_reconnect (callable): Coroutine function to call after
+            reconnecting.
+        coalesce (bool): Coalesce writes.
+    """
+    backoff_initial = .1
+    backoff_max = 10.
+    drain_time = .1
+    idle_time = .1
+    write_high_water = 1 << 12  # bytes
+    write_low_water = 1 << 10
+
+    def __init__(self, reader, writer, eol_read=b"\n", reopen=None,
+                 on_reconnect=None, coalesce=False):
+        self.eol_read = eol_read
+        self._reopen = reopen
+        self._on_reconnect = on_reconnect
+        self._pending = collections.deque()
+        self._held = None
+        self._wake = asyncio.Event()
+        self._reconnects = 0
+        self._downtime = 0.
+        self._down_since = None
+        self.metrics = None
+        self._last = None
+        self._coalesce = coalesce
+        # commands to be written at the end of the loop iteration or batch
+        self._wbuf = []
+        self._batch = 0
+        # number of pending replies to commands in the write buffer
+        self._wbuf_replies = 0
+        self._attach(reader, writer)
+        self._task = asyncio.ensure_future(self._run())
+
+    def _attach(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._up()
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family in (
+                socket.AF_INET, socket.AF_INET6):
+            # detect silently dropped connections
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer.transport.set_write_buffer_limits(
+            self.write_high_water, self.write_low_water)
+
+    def close(self):
+        self._task.cancel()
+        self._writer.close()
+
+    def write(self, data):
+        """Write a command.
+
+        Args:
+            data (bytes): Command including its terminator.
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            name = metrics.name(data)
+            metrics.record_command(name, len(data))
+            self._last = name, asyncio.get_event_loop().time()
+        if self._exc is not None:
+            if metrics is not None:
+                metrics.record_error(name, ConnectionError())
+            raise ConnectionError("not connected") from self._exc
+        if self._held is not None:
+            self._held.append(data)
+        elif self._batch:
+            self._wbuf.append(data)
+        elif self._coalesce:
+            if not self._wbuf:
+                asyncio.get_event_loop().call_soon(self._flush)
+            self._wbuf.append(data)
+        else:
+            self._writer.write(data)
+
+    def _flush(self):
+        if self._batch:
+            return  # written when the batch ends
+        data = b"".join(self._wbuf)
+        self._clear_wbuf()
+        if not data or self._exc is not None:
+            return
+        if self._held is not None:
+            self._held.append(data)
+        else:
+            self._writer.write(data)
+
+    def _clear_wbuf(self):
+        self._wbuf.clear()
+        self._wbuf_replies = 0
+
+    async def drain(self):
+        """Write pending coalesced commands and, if the stream write
+        buffer is above its high-water mark, wait until it is down to the
+        low-water mark."""
+        if self._exc is not None:
+            raise ConnectionError("not connected") from self._exc
+        self._flush()
+        await self._writer.drain()
+
+    def read(self, n=None, timeout=None):
+        """Queue a read of one reply.
+
+        Args:
+            n (int): Number of bytes to read. If `None`, read one
+                line including the terminator.
+            timeout (float): Deadline for the reply in seconds, counted
+                from when it is next in line. `None` waits forever.
+
+        Returns:
+            asyncio.Future: Resolves to the reply bytes.
+        """
+        fut = asyncio.get_event_loop().create_future()
+        if self._exc is not None:
+            fut.set_exception(ConnectionError("not connected"))
+        else:
+            self._pending.append((n, timeout, fut))
+            self._wake.set()
+            if self._wbuf:
+                self._wbuf_replies += 1
+        if self.metrics is not None and self._last is not None:
+            fut.add_done_callback(self._record(self.metrics, *self._last))
+            self._last = None
+        return fut
+
+    @staticmethod
+    def _record(metrics, name, t):
+        def cb(fut):
+            if fut.cancelled():
+                return
+            exc = fut.exception()
+            if exc is not None:
+                metrics.record_error(name, exc)
+            else:
+                metrics.record_reply(
+                    name, len(fut.result()),
+                    asyncio.get_event_loop().time() - t)
+        return cb
+
+    def link_stats(self):
+        """Return connection statistics.
+
+        Returns:
+            dict: `connected` status, number of `reconnects` and total
+                `downtime` in seconds.
+        """
+        downtime = self._downtime
+        if self._down_since is not None:
+            downtime += asyncio.get_event_loop().time() - self._down_since
+        return {
+            "connected": self._exc is None,
+            "reconnects": self._reconnects,
+            "downtime": downtime,
+        }
+
+    def _fail(self, exc):
+        if self._exc is None:
+            self._down_since = asyncio.get_event_loop().time()
+        self._exc = exc
+        self._held = None
+        self._clear_wbuf()
+        self._fail_pending(exc)
+
+    def _fail_pending(self, exc):
+        while self._pending:
+            _, _, fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(exc)
+
+    def _up(self):
+        if self._down_since is not None:
+            self._downtime += (asyncio.get_event_loop().time() -
+                               self._down_since)
+            self._down_since = None
+        self._exc = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._serve()
+            except asyncio.CancelledError:
+                self._fail(ConnectionAbortedError("transport closed"))
+                raise
+            except asyncio.IncompleteReadError:
+                logger.warning("connection closed by device")
+                self._fail(ConnectionResetError("connection closed by device"))
+            except Exception as e:
+                logger.warning("connection failed", exc_info=True)
+                self._fail(e)
+            self._writer.close()
+            if self._reopen is None:
+                return
+            await self._reconnect()
+
+    async def _serve(self):
+        # Once no reply has been expected for idle_time, a one byte read
+        # watches for the connection being closed. Its byte starts the
+        # next reply.
+        idle = None
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                if not self._pending:
+                    self._wake.clear()
+                    if idle is None:
+                        timer = loop.call_later(self.idle_time,
+                                                self._wake.set)
+                        await self._wake.wait()
+                        timer.cancel()
+                        if not self._pending:
+                            idle = asyncio.ensure_future(
+                                self._reader.read(1))
+                            idle.add_done_callback(
+                                lambda _: self._wake.set())
+                        continue
+                    await self._wake.wait()
+                    if not idle.done():
+                        continue
+                    if not idle.result():
+                        raise asyncio.IncompleteReadError(b"", None)
+                    if not self._pending:
+                        logger.warning("unexpected data, resynchronizing")
+                        logger.debug("discarding %r", idle.result())
+                        idle = None
+                        await self._resync()
+                        continue
+                n, timeout, fut = self._pending[0]
+                started, idle = idle, None
+                try:
+                    ret = await asyncio.wait_for(
+                        self._read_reply(n, started), timeout)
+                except asyncio.TimeoutError:
+                    logger.warning("reply timed out, resynchronizing")
+                    # replies that may still arrive for the sent commands
+                    late = list(self._pending)
+                    del late[len(late) - self._wbuf_replies:]
+                    # unsent commands of the failed requests
+                    self._clear_wbuf()
+                    self._fail_pending(asyncio.TimeoutError("reply timed out"))
+                    if started is not None and (
+                            started.cancelled() or not started.done()):
+                        started = None
+                    await self._resync(late, timeout, started)
+                    continue
+                self._pending.popleft()
+                # the caller may have given up (cancelled) in the meantime
+                if not fut.done():
+                    fut.set_result(ret)
+        finally:
+            if idle is not None:
+                idle.cancel()
+
+    async def _read_reply(self, n, idle):
+        data = b""
+        if idle is not None:
+            data = await idle
+            if not data:
+                raise asyncio.IncompleteReadError(data, n)
+        if n is not None:
+            return data + await self._reader.readexactly(n - len(data))
+        if not data:
+            return await self._reader.readuntil(self.eol_read)
+        while not data.endswith(self.eol_read):
+            data += await self._reader.readuntil(self.eol_read[-1:])
+        return data
+
+    async def _resync(self, late=(), timeout=None, started=None):
+        # hold back commands until the late replies have been discarded
+        # and the stream has been quiet
+        self._held = []
+        await self._discard(late, timeout, started)
+        await self._drain()
+        for data in self._held:
+            self._writer.write(data)
+        self._held = None
+
+    async def _discard(self, late, timeout, started):
+        # `started` is the idle read that may hold the first byte of the
+        # first late reply, `timeout` the deadline of requests without one
+        for n, t, _ in late:
+            try:
+                data = await asyncio.wait_for(
+                    self._read_reply(n, started),
+                    timeout if t is None else t)
+            except asyncio.TimeoutError:
+                return  # lost, the remainder is drained
+            started = None
+            logger.debug("discarding late reply %r", data)
+
+    async def _drain(self):
+        while True:
+            try:
+                data = await asyncio.wait_for(
+                    self._reader.read(1 << 12), self.drain_time)
+            except asyncio.TimeoutError:
+                return
+            if not data:
+                raise asyncio.IncompleteReadError(data, None)
+            logger.debug("discarding %r", data)
+
+    async def _reconnect(self):
+        delay = self.backoff_initial
+        while True:
+            try:
+                reader, writer = await self._reopen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.info("reconnect failed (%s), retrying in %g s",
+                            e, delay)
+                await asyncio.sleep(delay)
+                delay = min(2*delay, self.backoff_max)
+            else:
+                break
+        self._attach(reader, writer)
+        self._reconnects += 1
+        logger.warning("reconnected")
+        if self._on_reconnect is not None:
+            asyncio.ensure_future(self._restore())
+
+    async def _restore(self):
+        try:
+            await self._on_reconnect()
+        except asyncio.CancelledError:
+            raise
+        except:
+            logger.warning("restoring state failed", exc_info=True)
+
+
+class WriteBatch:
+    """Asynchronous context manager that sends the commands issued within
+    it with a single write.
+
+    Commands written directly in the block as well as those written by
+    tasks created in it (their first step runs when the block ends) are
+    collected. On exit they are written in order and the write buffer is
+    drained (see :meth:`StreamTransport.drain`). Replies are read as
+    usual.
+
+    Example::
+
+        async with dev.batch():
+            volt = asyncio.ensure_future(dev.set_voltage_bulk(values))
+            ldac = asyncio.ensure_future(dev.ldac())
+        await volt
+        await ldac
+
+    Batches can be nested; the commands are written when the outermost
+    one ends.
+
+    Args:
+        transport (StreamTransport): Transport to batch.
+    """
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def __aenter__(self):
+        self._transport._batch += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        transport = self._transport
+        try:
+            # let the tasks created in the block write their commands
+            await asyncio.sleep(0)
+        finally:
+            transport._batch -= 1
+        if not transport._batch:
+            await transport.drain()
+
+
+# values of boolean URL query parameters
+_flags = {"1": True, "true": True, "yes": True,
+          "0": False, "false": False, "no": False}
+
+
+class StreamDevice:
+    """Device connected through a :class:`StreamTransport`.
+
+    This provides the I/O methods of :class:`ptb.protocol.LineProtocol`.
+    Subclasses combine it with a protocol class and set the line
+    terminators :attr:`eol_write` and :attr:`eol_read`.
+
+    Args:
+        reader (asyncio.StreamReader): Stream to read replies from.
+        writer (asyncio.StreamWriter): Stream to write commands to.
+        reopen (callable): Coroutine function returning a new
+            `(reader, writer)` pair to reconnect. If `None`, a lost
+            connection is not re-established.
+        coalesce (bool): Coalesce writes (see :class:`StreamTransport`).
+    """
+    eol_write = b"\n"
+    eol_read = b"\n"
+
+    def __init__(self, reader, writer, reopen=None, coalesce=False):
+        super().__init__()
+        self._transport = StreamTransport(
+            reader, writer, self.eol_read, reopen, self._restore, coalesce)
+
+    @classmethod
+    async def connect(cls, host, port=80, reconnect=True, coalesce=False,
+                      **kwargs):
+        """Connect to a device over TCP.
+
+        Args:
+            host (str): Host name or IP address.
+            port (int): TCP port.
+            reconnect (bool): Re-establish a lost connection.
+            coalesce (bool): Coalesce writes (see
+                :class:`StreamTransport`).
+            kwargs: Passed to :func:`asyncio.open_connection`.
+        """
+        def reopen():
+            return asyncio.open_connection(host, port, **kwargs)
+        reader, writer = await reopen()
+        return cls(reader, writer, reopen if reconnect else None, coalesce)
+
+    @classmethod
+    async def connect_serial(cls, port, baudrate=115200,
+                             inter_byte_timeout=None, coalesce=True,
+                             reconnect=True, **kwargs):
+        """Connect to a device over a serial port (requires
+        `pyserial-asyncio`).
+
+        Args:
+            port (str): Serial port device or pySerial URL.
+            baudrate (int): Baud rate.
+            inter_byte_timeout (float): Inter-character timeout in
+                seconds, passed to pySerial.
+            coalesce (bool): Coalesce writes (see
+                :class:`StreamTransport`).
+            reconnect (bool): Re-open the port if it is lost (e.g. if a
+                USB adapter is unplugged).
+            kwargs: Passed to :func:`serial_asyncio.open_serial_connection`.
+        """
+        import serial_asyncio
+
+        def reopen():
+            return serial_asyncio.open_serial_connection(
+                url=port, baudrate=baudrate,
+                inter_byte_timeout=inter_byte_timeout, **kwargs)
+        reader, writer = await reopen()
+        return cls(reader, writer, reopen if reconnect else None, coalesce)
+
+    @classmethod
+    async def connect_url(cls, url, port=80, **kwargs):
+        """Connect to a device given by a URL.
+
+        Supported are `tcp://host[:port]` (see :meth:`connect`) and
+        `serial://device[?baudrate=115200&inter_byte_timeout=...]`
+        (see :meth:`connect_serial`, e.g. `serial:///dev/ttyUSB0`). A
+        plain host name or IP address is a TCP connection. Both URLs
+        accept a `coalesce=1` or `coalesce=0` query parameter (see
+        :class:`StreamTransport`).
+
+        Args:
+            url (str): Device URL.
+            port (int): Default TCP port.
+            kwargs: Passed to :meth:`connect` or :meth:`connect_serial`.
+        """
+        if "://" not in url:
+            return await cls.connect(url, port, **kwargs)
+        u = urllib.parse.urlsplit(url)
+        options = dict(urllib.parse.parse_qsl(u.query))
+        if "coalesce" in options:
+            coalesce = options.pop("coalesce").lower()
+            if coalesce not in _flags:
+                raise ValueError("invalid device URL `{}`".format(url))
+            kwargs["coalesce"] = _flags[coalesce]
+        if u.scheme == "tcp" and u.hostname and not options:
+            return await cls.connect(u.hostname, u.port or port, **kwargs)
+        if u.scheme == "serial" and u.netloc + u.path:
+            for k, t in (("baudrate", int), ("inter_byte_timeout", float)):
+                if k in options:
+                    kwargs[k] = t(options.pop(k))
+            if not options:
+                return await cls.connect_serial(u.netloc + u.path, **kwargs)
+        raise ValueError("invalid device URL `{}`".format(url))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._transport.close()
+
+    def get_link_stats(self):
+        """Return connection statistics (see
+        :meth:`ptb.transport.StreamTransport.link_stats`)."""
+        return self._transport.link_stats()
+
+    def enable_metrics(self, enable=True):
+        """Enable or disable recording per-command metrics (see
+        :meth:`get_stats`). Disabling discards the metrics recorded."""
+        self._transport.metrics = (
+            Metrics(self._command_name) if enable else None)
+
+    def get_stats(self):
+        """Return per-command metrics (see
+        :meth:`ptb.metrics.Metrics.get_stats`), `None` if disabled."""
+        metrics = self._transport.metrics
+        if metrics is not None:
+            return metrics.get_stats()
+
+    def batch(self):
+        """Return a :class:`WriteBatch` to send several commands with one
+        write."""
+        return WriteBatch(self._transport)
+
+    async def drain(self):
+        """Apply backpressure to command bursts (see
+        :meth:`StreamTransport.drain`)."""
+        await self._transport.drain()
+
+    def _encode(self, cmd):
+        if not isinstance(cmd, bytes):
+            cmd = cmd.encode()
+        return cmd + self.eol_write
+
+    def _writeline(self, cmd):
+        self._transport.write(self._encode(cmd))
+
+    def _write(self, data):
+        self._transport.write(data)
+
+    async def _readline(self, timeout=None):
+        r = await self._transport.read(timeout=timeout)
+        r = r[:-len(self.eol_read)]
+        if self.text:
+            r = r.decode()
+        return r
+
+    async def _read(self, n, timeout=None):
+        return await self._transport.read(n, timeout)
@@ -0,0 +1,145 @@
+import numpy as np
+
+
+class VoltageCalibration:
+    """Host-side model of the voltage to DAC value conversion done by the
+    voltage source microcontroller.
+
+    The DAC value of a channel is `zero + offset + gain*voltage`, rounded
+    to the nearest integer and clamped to `0...data_max`. Gains are given
+    in `2**16/full_scale` where `full_scale = u_max - u_min`, offsets in
+    DAC LSBs.
+
+    The gains and offsets of all channels are initially unknown. They
+    become known through :meth:`update`. Converting for channels whose
+    gain or offset is unknown raises :class:`ValueError`.
+
+    All conversions are vectorized: values are arrays whose last axis
+    runs over the target channels.
+    """
+    zero = 0x8000  # DAC value at zero voltage and offset
+    data_max = 0xffff
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget all gains and offsets (e.g. after a factory reset)."""
+        # NaN where unknown, indexed by channel - 1
+        self.gain = np.empty(0)
+        self.offset = np.empty(0)
+
+    def update(self, name, values, channels):
+        """Set the gains or offsets of channels.
+
+        Args:
+            name (str): `gain` or `offset`.
+            values (array): New values, one for each channel.
+            channels (array(int)): Channels (starting at 1).
+        """
+        if name not in ("gain", "offset"):
+            raise ValueError("invalid parameter")
+        index = np.asarray(channels, np.int64) - 1
+        values = np.asarray(values, np.float64)
+        valid = index >= 0
+        index, values = index[valid], values[valid]
+        if not len(index):
+            return
+        n = index.max() + 1
+        if n > len(self.gain):
+            self.gain = np.concatenate(
+                [self.gain, np.full(n - len(self.gain), np.nan)])
+            self.offset = np.concatenate(
+                [self.offset, np.full(n - len(self.offset), np.nan)])
+        getattr(self, name)[index] = values
+
+    def known(self, channels):
+        """Return whether the gains and offsets of channels are known.
+
+        Args:
+            channels (array(int)): Channels.
+
+        Returns:
+            array(bool): Known channels.
+        """
+        index = np.asarray(channels, np.int64) - 1
+        known = np.zeros(index.shape, np.bool_)
+        valid = (index >= 0) & (index < len(self.gain))
+        known[valid] = ~(np.isnan(self.gain[index[valid]]) |
+                         np.isnan(self.offset[index[valid]]))
+        return known
+
+    @staticmethod
+    def gain_offset(u_min, u_max):
+        """Return the gain and offset that map the DAC range onto a
+        voltage range.
+
+        Args:
+            u_min (array(float)): Voltage at DAC value 0.
+            u_max (array(float)): Voltage at DAC value `2**16`.
+
+        Returns:
+            tuple(array(float), array(int)): Gains and offsets.
+        """
+        u_min = np.asarray(u_min, np.float64)
+        gain = 2**16/(np.asarray(u_max, np.float64) - u_min)
+        offset = np.rint(-VoltageCalibration.zero - gain*u_min)
+        return gain, offset.astype(np.int64)
+
+    def _get(self, channels, n):
+        if channels is None:
+            channels = np.arange(1, n + 1)
+        known = self.known(channels)
+        if not known.all():
+            raise ValueError("calibration unknown for channels",
+                             np.asarray(channels)[~known].tolist())
+        index = np.asarray(channels, np.int64) - 1
+        return self.gain[index], self.offset[index]
+
+    def voltage_to_data(self, values, channels=None):
+        """Compute the DAC values the device sets for voltages.
+
+        Args:
+            values (array(float)): Voltages, last axis over the channels.
+            channels (array(int)): Target channels. Defaults to
+                1...values.shape[-1]
+
+        Returns:
+            array(int): DAC values, same shape as `values`.
+        """
+        values = np.asarray(values, np.float64)
+        gain, offset = self._get(channels, values.shape[-1])
+        data = np.rint(self.zero + offset + gain*values)
+        return np.clip(data, 0, self.data_max).astype(np.int64)
+
+    def data_to_voltage(self, data, channels=None):
+        """Compute the output voltages for DAC values.
+
+        Args:
+            data (array(int)): DAC values, last axis over the channels.
+            channels (array(int)): Target channels. Defaults to
+                1...data.shape[-1]
+
+        Returns:
+            array(float): Voltages, same shape as `data`.
+        """
+        data = np.asarray(data, np.float64)
+        gain, offset = self._get(channels, data.shape[-1])
+        return (data - self.zero - offset)/gain
+
+    def limits(self, channels):
+        """Return the voltage range of channels.
+
+        Voltages outside are clamped to the range ends.
+
+        Args:
+            channels (array(int)): Channels.
+
+        Returns:
+            tuple(array(float), array(float)): Lowest and highest
+                voltage of each channel.
+        """
+        data = np.zeros((2, len(channels)))
+        data[1] = self.data_max
+        u = self.data_to_voltage(data, channels)
+        return u.min(0), u.max(0)
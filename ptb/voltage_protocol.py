@@ -1,25 +1,36 @@
 import logging
 import asyncio
+import collections
 
-logger = logging.getLogger(__name__)
-
+import numpy as np
 
-class VoltageProtocol:
-    """Protocol for the PTB multi-channel voltage source"""
+from .protocol import LineProtocol
+from .voltage_calibration import VoltageCalibration
 
-    def do(self, cmd):
-        logger.debug("do %s", cmd)
-        self._writeline(cmd)
+logger = logging.getLogger(__name__)
 
-    async def ask(self, cmd):
-        self.do(cmd)
-        ret = await self._readline()
-        logger.debug("ret %s", ret)
-        return ret
 
-    async def read(self, n):
-        ret = await self._read(n)
-        return ret.decode()
+class VoltageProtocol(LineProtocol):
+    """Protocol for the PTB multi-channel voltage source"""
+    timeout = 2.  # reply deadline in seconds
+
+    def __init__(self):
+        # last values set per parameter and channel, replayed on reconnect
+        self._setpoints = {name: {}
+                           for name in ("gain", "offset", "volt", "data")}
+        # values last acknowledged by the device per parameter and channel,
+        # used to skip redundant writes
+        self._shadow = {name: {} for name in self._setpoints}
+        # volt/data values set but not yet loaded by ldac
+        self._ldac_pending = False
+        # command templates and argument buffers for bulk updates
+        self._bulk = {}
+        # host-side model of the gains and offsets on the device
+        self.calibration = VoltageCalibration()
+
+    def _command_name(self, data):
+        # action and parameter, e.g. "set volt"
+        return " ".join(data.decode(errors="replace").split()[:2])
 
     async def version(self):
         """Return the hardware/firmware version.
@@ -29,22 +40,6 @@ class VoltageProtocol:
         """
         return (await self.ask("get version")).strip()
 
-    def _writeline(self, cmd):
-        raise NotImplemented
-
-    async def _readline(self):
-        raise NotImplemented
-
-    async def ping(self):
-        try:
-            await self.version()
-        except asyncio.CancelledError:
-            raise
-        except:
-            logger.warning("ping failed", exc_info=True)
-            return False
-        return True
-
     async def _cmd(self, action, name, args=""):
         assert action in ("get", "set")
         cmd = "{} {}".format(action, name)
@@ -62,19 +57,57 @@ class VoltageProtocol:
         ret = await self._cmd("get", "temp")
         return [int(_) for _ in ret.split()]
 
-    def ldac(self):
+    async def ldac(self):
         """Pulse LDAC to all DACs to load values into active registers."""
-        return self._cmd("set", "ldac")
+        ret = await self._cmd("set", "ldac")
+        self._ldac_pending = False
+        return ret
 
-    def factory(self):
+    async def factory(self):
         """Reset gains and offsets to default values"""
-        return self._cmd("set", "factory")
+        ret = await self._cmd("set", "factory")
+        self._setpoints["gain"].clear()
+        self._setpoints["offset"].clear()
+        self.invalidate_cache()
+        self.calibration.reset()
+        return ret
+
+    def invalidate_cache(self, channels=None):
+        """Forget the values last acknowledged by the device so that they
+        are sent again on the next write.
 
-    async def _values(self, action, name, values, channels=None):
+        Args:
+            channels (list(int)): Channels to invalidate. Defaults to all.
+        """
+        for shadow in self._shadow.values():
+            if channels is None:
+                shadow.clear()
+            else:
+                for channel in channels:
+                    shadow.pop(channel, None)
+
+    async def _values(self, action, name, values, channels=None,
+                      force=True):
         if channels is None:
             channels = list(range(1, len(values) + 1))
+        if not force:
+            shadow = self._shadow[name]
+            changed = [i for i, (channel, value)
+                       in enumerate(zip(channels, values))
+                       if shadow.get(channel) != value]
+            if len(changed) < len(channels):
+                values_ret = [shadow.get(channel) for channel in channels]
+                if changed:
+                    ret, _ = await self._values(
+                        action, name, [values[i] for i in changed],
+                        [channels[i] for i in changed])
+                    for i, value in zip(changed, ret):
+                        values_ret[i] = value
+                return values_ret, channels
         args = " ".join("{} {}".format(channel, value)
                         for channel, value in zip(channels, values))
+        if action == "set":
+            self._forget(name, channels)
         ret = await self._cmd(action, name,
                               " {} {}".format(len(values), args))
         v = ret.split()
@@ -85,25 +118,111 @@ class VoltageProtocol:
         values_ret = v[1::2]
         assert channels_ret == channels
         # assert values_ret == values
+        if action == "set":
+            self._record(name, values, channels)
         return values_ret, channels_ret
 
-    async def set_voltage(self, values, channels=None):
+    def _forget(self, name, channels):
+        # The device may apply a write even if its reply is lost. Forget
+        # the acknowledged values it affects until the echo is checked.
+        affected = {"volt": "data", "data": "volt"}.get(name, "volt")
+        for channel in channels:
+            self._shadow[name].pop(channel, None)
+            self._shadow[affected].pop(channel, None)
+
+    def _record(self, name, values, channels):
+        self._setpoints[name].update(zip(channels, values))
+        self._shadow[name].update(zip(channels, values))
+        other = {"volt": "data", "data": "volt"}.get(name)
+        if other is not None:
+            for channel in channels:
+                self._setpoints[other].pop(channel, None)
+                self._shadow[other].pop(channel, None)
+            self._ldac_pending = True
+        else:
+            # gain and offset only take effect on the next volt
+            for channel in channels:
+                self._shadow["volt"].pop(channel, None)
+            self.calibration.update(name, values, channels)
+
+    async def _restore(self):
+        # replay setpoints after reconnecting
+        self.invalidate_cache()
+        # the device may have been reset
+        self.calibration.reset()
+        loaded = not self._ldac_pending
+        for name in ("gain", "offset", "volt", "data"):
+            if self._setpoints[name]:
+                channels, values = zip(*sorted(self._setpoints[name].items()))
+                await self._values("set", name, list(values), list(channels))
+        if loaded and (self._setpoints["volt"] or self._setpoints["data"]):
+            await self.ldac()
+
+    def transaction(self):
+        """Start collecting changes to be applied in one burst.
+
+        Returns:
+            VoltageTransaction: The transaction. Changes are sent on
+                :meth:`VoltageTransaction.commit`.
+        """
+        return VoltageTransaction(self)
+
+    async def configure(self, channels=None, gain=None, offset=None,
+                        voltage=None, data=None, ldac=True):
+        """Set several parameters of a set of channels at once.
+
+        This is a shortcut for a :meth:`transaction` (see there). Each
+        given parameter has one value per channel. Only one of `voltage`
+        and `data` can be given.
+
+        Args:
+            channels (list(int)): Target channels. Defaults to
+                1...len(values)
+            gain (list(float)): Gains.
+            offset (list(int)): Offsets.
+            voltage (list(float)): Voltages.
+            data (list(int)): DAC values.
+            ldac (bool): Load the new voltages or data.
+
+        Returns:
+            dict: Actual values returned by the device (see
+                :meth:`VoltageTransaction.commit`).
+        """
+        if voltage is not None and data is not None:
+            raise ValueError("voltage and data are exclusive")
+        t = self.transaction()
+        if gain is not None:
+            t.set_gain(gain, channels)
+        if offset is not None:
+            t.set_offset(offset, channels)
+        if voltage is not None:
+            t.set_voltage(voltage, channels)
+        if data is not None:
+            t.set_data(data, channels)
+        if ldac:
+            t.ldac()
+        return await t.commit()
+
+    async def set_voltage(self, values, channels=None, force=False):
         """Set output voltages. Voltages become active only after
         :meth:`ldac`.
 
         Args:
             values (list(float)): Voltages, one for each target channel.
             channels (list(int)): Target channels. Defaults to 1...len(values)
+            force (bool): Also send values that are unchanged from the
+                ones last acknowledged by the device.
 
         Returns:
             list(float): Actual values returned by the device.
         """
         values = ["{:.4f}".format(_) for _ in values]
-        values, channels = await self._values("set", "volt", values, channels)
+        values, channels = await self._values("set", "volt", values, channels,
+                                              force)
         values = [float(_) for _ in values]
         return values, channels
 
-    async def set_gain(self, values, channels=None):
+    async def set_gain(self, values, channels=None, force=False):
         """Set channel gains. Channel gains are processed within the
         microcontroller and become active on :meth:`set_volt` and a subsequent
         :meth:`ldac`.
@@ -114,16 +233,19 @@ class VoltageProtocol:
         Args:
             values (list(float)): Gains, one for each target channel.
             channels (list(int)): Target channels. Defaults to 1...len(values)
+            force (bool): Also send values that are unchanged from the
+                ones last acknowledged by the device.
 
         Returns:
             list(float): Actual values returned by the device.
         """
         values = ["{:.4f}".format(_) for _ in values]
-        values, channels = await self._values("set", "gain", values, channels)
+        values, channels = await self._values("set", "gain", values, channels,
+                                              force)
         values = [float(_) for _ in values]
         return values, channels
 
-    async def set_offset(self, values, channels=None):
+    async def set_offset(self, values, channels=None, force=False):
         """Set channel offsets. Channel gains are processed within the
         microcontroller and become active on :meth:`set_volt` and a subsequent
         :meth:`ldac`.
@@ -133,28 +255,34 @@ class VoltageProtocol:
         Args:
             values (list(int)): Offsets, one for each target channel.
             channels (list(int)): Target channels. Defaults to 1...len(values)
+            force (bool): Also send values that are unchanged from the
+                ones last acknowledged by the device.
 
         Returns:
             list(int): Actual values returned by the device.
         """
         values = ["{:d}".format(_) for _ in values]
-        values, channels = await self._values("set", "offset", values, channels)
+        values, channels = await self._values("set", "offset", values,
+                                              channels, force)
         values = [int(_) for _ in values]
         return values, channels
 
-    async def set_data(self, values, channels=None):
+    async def set_data(self, values, channels=None, force=False):
         """Set raw channel output values. Values are given in DAC LSBs
         (integers). Data becomes active only after :meth:`ldac`.
 
         Args:
             values (list(int)): DAC values, one for each target channel.
             channels (list(int)): Target channels. Defaults to 1...len(values)
+            force (bool): Also send values that are unchanged from the
+                ones last acknowledged by the device.
 
         Returns:
             list(int): Actual values returned by the device.
         """
         values = ["{:d}".format(_) for _ in values]
-        values, channels = await self._values("set", "data", values, channels)
+        values, channels = await self._values("set", "data", values, channels,
+                                              force)
         values = [int(_) for _ in values]
         return values, channels
 
@@ -173,4 +301,499 @@ class VoltageProtocol:
         values = ["0" for i in range(len(channels))]
         values, channels = await self._values("get", "data", values, channels)
         values = [int(_) for _ in values]
+        shadow = self._shadow["data"]
+        mismatch = [channel for channel, value in zip(channels, values)
+                    if channel in shadow and int(shadow[channel]) != value]
+        if mismatch:
+            logger.warning("data mismatch on channels %s", mismatch)
+            self.invalidate_cache(mismatch)
         return values, channels
+
+    async def sync_calibration(self, channels=None):
+        """Read the gains and offsets from the device into
+        :attr:`calibration`.
+
+        The gains and offsets of a channel are otherwise only known to
+        the model once they have been set through this driver. They are
+        unknown after connecting, reconnecting and :meth:`factory`.
+
+        Args:
+            channels (list(int)): Target channels. Defaults to 1...8
+
+        Returns:
+            tuple(array(float), array(int)): Gains and offsets.
+        """
+        if channels is None:
+            channels = list(range(1, 8 + 1))
+        zeros = ["0" for i in range(len(channels))]
+        gain, _ = await self._values("get", "gain", zeros, channels)
+        offset, _ = await self._values("get", "offset", zeros, channels)
+        self.calibration.update("gain", [float(_) for _ in gain], channels)
+        self.calibration.update("offset", [int(_) for _ in offset],
+                                channels)
+        index = np.asarray(channels) - 1
+        return (self.calibration.gain[index],
+                self.calibration.offset[index].astype(np.int64))
+
+    async def _calibrated(self, channels, n):
+        # read the calibration of channels the model does not know
+        if channels is None:
+            channels = list(range(1, n + 1))
+        known = self.calibration.known(channels)
+        if not known.all():
+            await self.sync_calibration(
+                [int(_) for _ in np.asarray(channels)[~known]])
+
+    def voltage_to_data(self, values, channels=None):
+        """Compute the DAC values the device sets for voltages, using
+        :attr:`calibration`.
+
+        Args:
+            values (array(float)): Voltages, last axis over the channels.
+            channels (array(int)): Target channels. Defaults to
+                1...values.shape[-1]
+
+        Returns:
+            array(int): DAC values.
+
+        Raises:
+            ValueError: If the calibration of a channel is unknown (see
+                :meth:`sync_calibration`).
+        """
+        return self.calibration.voltage_to_data(values, channels)
+
+    def predict_data(self, values, channels=None):
+        """Compute the DAC values the device sets for voltages sent with
+        :meth:`set_voltage` or :meth:`set_voltage_bulk`, using
+        :attr:`calibration`.
+
+        Unlike :meth:`voltage_to_data`, this takes into account that
+        voltages are sent with four decimals.
+
+        Args:
+            values (array(float)): Voltages, last axis over the channels.
+            channels (array(int)): Target channels. Defaults to
+                1...values.shape[-1]
+
+        Returns:
+            array(int): DAC values.
+
+        Raises:
+            ValueError: If the calibration of a channel is unknown (see
+                :meth:`sync_calibration`).
+        """
+        values = np.round(np.asarray(values, np.float64), 4)
+        return self.calibration.voltage_to_data(values, channels)
+
+    def data_to_voltage(self, data, channels=None):
+        """Compute the output voltages for DAC values, using
+        :attr:`calibration`.
+
+        Args:
+            data (array(int)): DAC values, last axis over the channels.
+            channels (array(int)): Target channels. Defaults to
+                1...data.shape[-1]
+
+        Returns:
+            array(float): Voltages.
+
+        Raises:
+            ValueError: If the calibration of a channel is unknown (see
+                :meth:`sync_calibration`).
+        """
+        return self.calibration.data_to_voltage(data, channels)
+
+    async def _values_bulk(self, name, fmt, values, channels, verify):
+        n = len(values)
+        if channels is None:
+            channels = list(range(1, n + 1))
+        else:
+            channels = [int(_) for _ in channels]
+        try:
+            template, args = self._bulk[(fmt, n)]
+        except KeyError:
+            template = " {}".format(n) + (" {:d} " + fmt)*n
+            args = [None]*(2*n)
+            self._bulk[(fmt, n)] = template, args
+        args[::2] = channels
+        args[1::2] = values.tolist()
+        args = template.format(*args)
+        self._forget(name, channels)
+        ret = await self._cmd("set", name, args)
+        if verify:
+            v = np.fromstring(ret, sep=" ")
+            assert len(v) == 2*n + 1 and v[0] == n
+            assert v[1::2].tolist() == channels
+        self._record(name, args.split()[2::2], channels)
+        if verify:
+            return v[2::2], np.array(channels)
+
+    async def set_voltage_bulk(self, values, channels=None, verify=True):
+        """Set output voltages from an array. Voltages become active only
+        after :meth:`ldac`.
+
+        This is a faster variant of :meth:`set_voltage` for frequent
+        updates of many channels.
+
+        Args:
+            values (array(float)): Voltages, one for each target channel.
+            channels (array(int)): Target channels.
+                Defaults to 1...len(values)
+            verify (bool): Parse and check the echoed reply.
+
+        Returns:
+            tuple(array(float), array(int)): Actual values and channels
+                returned by the device, `None` if not verified.
+        """
+        values = np.asarray(values, np.float64)
+        return await self._values_bulk("volt", "{:.4f}", values, channels,
+                                       verify)
+
+    async def set_data_bulk(self, values, channels=None, verify=True):
+        """Set raw channel output values (DAC LSBs) from an array. Data
+        becomes active only after :meth:`ldac`.
+
+        This is a faster variant of :meth:`set_data` for frequent
+        updates of many channels.
+
+        Args:
+            values (array(int)): DAC values, one for each target channel.
+            channels (array(int)): Target channels.
+                Defaults to 1...len(values)
+            verify (bool): Parse and check the echoed reply.
+
+        Returns:
+            tuple(array(int), array(int)): Actual values and channels
+                returned by the device, `None` if not verified.
+        """
+        values = np.asarray(values, np.int64)
+        ret = await self._values_bulk("data", "{:d}", values, channels,
+                                      verify)
+        if ret is not None:
+            ret = ret[0].astype(np.int64), ret[1]
+        return ret
+
+    async def set_voltage_data(self, values, channels=None, verify=True):
+        """Set output voltages as DAC values converted on the host (see
+        :attr:`calibration`). Data becomes active only after :meth:`ldac`.
+
+        The device output is the same as with :meth:`set_voltage_bulk`,
+        but the DAC values are known without reading them back. The
+        calibration of channels unknown to the model is read first (see
+        :meth:`sync_calibration`).
+
+        Args:
+            values (array(float)): Voltages, one for each target channel.
+            channels (array(int)): Target channels.
+                Defaults to 1...len(values)
+            verify (bool): Parse and check the echoed reply.
+
+        Returns:
+            tuple(array(int), array(int)): DAC values and channels
+                returned by the device, `None` if not verified.
+        """
+        values = np.asarray(values, np.float64)
+        await self._calibrated(channels, len(values))
+        data = self.calibration.voltage_to_data(values, channels)
+        return await self.set_data_bulk(data, channels, verify)
+
+    async def stream_voltage(self, times, values, channels=None,
+                             max_in_flight=16, raw=False):
+        """Play a multi-channel voltage waveform.
+
+        For each time point, the voltages are sent ahead of time and
+        :meth:`ldac` is issued at the scheduled time. Up to `max_in_flight`
+        steps are pipelined without waiting for the device to acknowledge
+        them.
+
+        Args:
+            times (array(float)): Non-decreasing time points in seconds
+                relative to the start, shape (N,).
+            values (array(float)): Voltages, shape (N, len(channels)).
+            channels (list(int)): Target channels. Defaults to
+                1...values.shape[1]
+            max_in_flight (int): Maximum number of unacknowledged steps.
+            raw (bool): Convert the whole waveform to DAC values up front
+                (see :meth:`set_voltage_data`) and send those.
+
+        Returns:
+            dict: Timing statistics in seconds: `steps`, total `duration`,
+                mean, standard deviation (`jitter`) and maximum of the
+                lateness of the LDAC commands (`late_mean`, `jitter`,
+                `late_max`), and mean and maximum of the time until the
+                device acknowledged them (`ack_mean`, `ack_max`).
+        """
+        times = np.asarray(times, np.float64)
+        values = np.asarray(values, np.float64)
+        if values.ndim != 2 or times.shape != values.shape[:1]:
+            raise ValueError("shape mismatch")
+        if not len(times):
+            raise ValueError("empty waveform")
+        if np.any(np.diff(times) < 0):
+            raise ValueError("times must be non-decreasing")
+        set_bulk = self.set_voltage_bulk
+        if raw:
+            await self._calibrated(channels, values.shape[1])
+            values = self.calibration.voltage_to_data(values, channels)
+            set_bulk = self.set_data_bulk
+        loop = asyncio.get_event_loop()
+        late = np.empty(len(times))
+        ack = np.empty(len(times))
+        in_flight = collections.deque()
+
+        def acked(i, t):
+            def cb(fut):
+                ack[i] = loop.time() - t
+            return cb
+
+        async def settle(step):
+            # wait for all commands of the step before raising
+            for ret in await asyncio.gather(*step, return_exceptions=True):
+                if isinstance(ret, BaseException):
+                    raise ret
+
+        t0 = loop.time()
+        try:
+            for i in range(len(times)):
+                # Tasks run their first step (writing the command) in
+                # creation order, so the voltages always precede their ldac.
+                step = [asyncio.ensure_future(set_bulk(
+                    values[i], channels, verify=False))]
+                in_flight.append(step)
+                delay = t0 + times[i] - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                t = loop.time()
+                late[i] = t - t0 - times[i]
+                ldac = asyncio.ensure_future(self.ldac())
+                ldac.add_done_callback(acked(i, t))
+                step.append(ldac)
+                while len(in_flight) > max_in_flight:
+                    await settle(in_flight.popleft())
+            while in_flight:
+                await settle(in_flight.popleft())
+        finally:
+            futs = [fut for step in in_flight for fut in step]
+            for fut in futs:
+                fut.cancel()
+            # retrieve the exceptions of steps that failed meanwhile
+            await asyncio.gather(*futs, return_exceptions=True)
+        return {
+            "steps": len(times),
+            "duration": loop.time() - t0,
+            "late_mean": float(late.mean()),
+            "jitter": float(late.std()),
+            "late_max": float(late.max()),
+            "ack_mean": float(ack.mean()),
+            "ack_max": float(ack.max()),
+        }
+
+
+class VoltageTransaction:
+    """Changes to gains, offsets, voltages and DAC values of any channels,
+    applied together.
+
+    On :meth:`commit`, all changes are sent as one pipelined burst (in
+    the order gains, offsets, voltages and data, and LDAC) so that they
+    take about one round trip instead of one per parameter. The echoes
+    are then verified in one pass. If any of them does not match, the
+    previous values are restored.
+
+    Create transactions with :meth:`VoltageProtocol.transaction`.
+
+    Args:
+        dev (VoltageProtocol): Device.
+    """
+    # parameters in the order they are applied
+    names = ("gain", "offset", "volt", "data")
+    # value formats
+    formats = {"gain": "{:.4f}", "offset": "{:d}", "volt": "{:.4f}",
+               "data": "{:d}"}
+    # largest deviation of an echoed value to still match
+    tolerance = {"gain": 1e-4, "offset": 0, "volt": 1e-4, "data": 0}
+
+    def __init__(self, dev):
+        self._dev = dev
+        self._changes = {name: {} for name in self.names}
+        self._ldac = False
+
+    def _set(self, name, values, channels):
+        if channels is None:
+            channels = list(range(1, len(values) + 1))
+        if len(values) != len(channels):
+            raise ValueError("values and channels differ in length")
+        fmt = self.formats[name]
+        changes = self._changes[name]
+        other = self._changes.get({"volt": "data", "data": "volt"}.get(name))
+        for channel, value in zip(channels, values):
+            changes[int(channel)] = fmt.format(value)
+            if other is not None:
+                # the later of volt and data wins
+                other.pop(int(channel), None)
+
+    def set_gain(self, values, channels=None):
+        """Set channel gains (see :meth:`VoltageProtocol.set_gain`).
+
+        Args:
+            values (list(float)): Gains, one for each target channel.
+            channels (list(int)): Target channels. Defaults to
+                1...len(values)
+        """
+        self._set("gain", values, channels)
+
+    def set_offset(self, values, channels=None):
+        """Set channel offsets in DAC LSBs (see
+        :meth:`VoltageProtocol.set_offset`).
+
+        Args:
+            values (list(int)): Offsets, one for each target channel.
+            channels (list(int)): Target channels. Defaults to
+                1...len(values)
+        """
+        self._set("offset", values, channels)
+
+    def set_voltage(self, values, channels=None):
+        """Set output voltages (see :meth:`VoltageProtocol.set_voltage`).
+
+        Args:
+            values (list(float)): Voltages, one for each target channel.
+            channels (list(int)): Target channels. Defaults to
+                1...len(values)
+        """
+        self._set("volt", values, channels)
+
+    def set_data(self, values, channels=None):
+        """Set raw channel output values (see
+        :meth:`VoltageProtocol.set_data`).
+
+        Args:
+            values (list(int)): DAC values, one for each target channel.
+            channels (list(int)): Target channels. Defaults to
+                1...len(values)
+        """
+        self._set("data", values, channels)
+
+    def ldac(self):
+        """Load the new voltages and data after setting them."""
+        self._ldac = True
+
+    def _commands(self, changes):
+        cmds = []
+        for name in self.names:
+            if changes[name]:
+                channels, values = zip(*sorted(changes[name].items()))
+                args = " ".join("{} {}".format(channel, value)
+                                for channel, value in zip(channels, values))
+                cmds.append((name, list(channels), list(values),
+                             "set {} {} {}".format(name, len(values), args)))
+        return cmds
+
+    async def _send(self, cmds, ldac):
+        dev = self._dev
+        # tasks write their commands in creation order without waiting for
+        # the replies
+        rets = await asyncio.gather(
+            *([dev.ask(cmd) for _, _, _, cmd in cmds] +
+              ([dev.ask("set ldac")] if ldac else [])))
+        mismatch = []
+        if ldac and rets.pop().strip() != "set ldac":
+            mismatch.append("ldac")
+        echoes = []
+        for (name, channels, values, _), ret in zip(cmds, rets):
+            v = ret.split()
+            if (v[:3] != ["set", name, str(len(values))] or
+                    len(v) != 2*len(values) + 3):
+                mismatch.append(name)
+                continue
+            try:
+                channels_ret = [int(_) for _ in v[3::2]]
+                values_ret = [float(_) for _ in v[4::2]]
+            except ValueError:
+                mismatch.append(name)
+                continue
+            tolerance = self.tolerance[name]
+            mismatch.extend(
+                "{} {}".format(name, channel)
+                for channel, channel_ret, value, value_ret in zip(
+                    channels, channels_ret, values, values_ret)
+                if channel != channel_ret or
+                abs(float(value) - value_ret) > tolerance)
+            echoes.append((name, values_ret, channels_ret))
+        return echoes, mismatch
+
+    async def _rollback(self, cmds, ldac):
+        dev = self._dev
+        setpoints = dev._setpoints
+        changed = {name: {} for name in self.names}
+        output = set()
+        for name, channels, _, _ in cmds:
+            if name in ("volt", "data"):
+                output.update(channels)
+            elif name in ("gain", "offset"):
+                for channel in channels:
+                    if channel in setpoints[name]:
+                        changed[name][channel] = setpoints[name][channel]
+                    else:
+                        logger.warning("no previous %s on channel %s",
+                                       name, channel)
+        # gains and offsets affect the voltages of their channels
+        for channel in output.union(changed["gain"], changed["offset"]):
+            for name in ("volt", "data"):
+                if channel in setpoints[name]:
+                    changed[name][channel] = setpoints[name][channel]
+                    break
+            else:
+                if channel in output:
+                    logger.warning("no previous output on channel %s",
+                                   channel)
+        dev.invalidate_cache(sorted(output.union(*changed.values())))
+        _, mismatch = await self._send(self._commands(changed), ldac)
+        if ldac and "ldac" not in mismatch:
+            dev._ldac_pending = False
+        return mismatch
+
+    async def commit(self):
+        """Send the changes and verify the echoes.
+
+        The transaction is empty afterwards and can be reused.
+
+        Returns:
+            dict: Actual values returned by the device as for the
+                `set_...` methods: `(values, channels)` by parameter name
+                (`gain`, `offset`, `volt`, `data`).
+
+        Raises:
+            ValueError: If the device did not acknowledge all changes. The
+                previous values are then restored where known.
+            asyncio.TimeoutError: If a reply did not arrive. The changes
+                are not rolled back; the cached values of all affected
+                channels are invalidated.
+        """
+        cmds = self._commands(self._changes)
+        ldac = self._ldac
+        self._changes = {name: {} for name in self.names}
+        self._ldac = False
+        dev = self._dev
+        try:
+            echoes, mismatch = await self._send(cmds, ldac)
+        except:
+            # some of the changes may have been applied
+            dev.invalidate_cache(sorted(set().union(
+                *(channels for _, channels, _, _ in cmds))))
+            raise
+        if mismatch:
+            logger.warning("mismatch on %s, rolling back", mismatch)
+            failed = await self._rollback(cmds, ldac)
+            if failed:
+                logger.error("rollback failed on %s", failed)
+            raise ValueError("transaction failed", mismatch)
+        ret = {}
+        for (name, channels, values, _), (_, values_ret, channels_ret) in \
+                zip(cmds, echoes):
+            dev._record(name, values, channels)
+            if name in ("offset", "data"):
+                values_ret = [int(_) for _ in values_ret]
+            ret[name] = values_ret, channels_ret
+        if ldac:
+            dev._ldac_pending = False
+        return ret
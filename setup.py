@@ -17,13 +17,15 @@ setup(
     url="https://github.com/quartiq/ptb-drivers",
     download_url="https://github.com/quartiq/ptb-drivers",
     packages=find_packages(),
-    install_requires=[],
+    install_requires=["numpy"],
     entry_points={
         "console_scripts": [
             "aqctl_ptb_synth = ptb.aqctl_ptb_synth:main",
             "aqctl_ptb_voltage = ptb.aqctl_ptb_voltage:main",
             "aqctl_ptb_temp = ptb.aqctl_ptb_temp:main",
             "aqctl_ptb_shutter = ptb.aqctl_ptb_shutter:main",
+            "aqctl_ptb_rack = ptb.aqctl_ptb_rack:main",
+            "ptb_sim = ptb.sim:main",
         ],
     },
     test_suite="ptb.test",